@@ -0,0 +1,195 @@
+import functools
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from bootstrap_stats import build_series_matrix
+
+# Outlier quarters and structural changepoints for every Facility x Procedure series.
+#
+# All series are packed into one padded matrix (see bootstrap_stats), and both
+# detectors are computed with whole-matrix NumPy operations:
+#   - robust z-scores: 0.6745 * (x - median) / MAD per series (Iglewicz and
+#     Hoaglin's modified z-score)
+#   - changepoints: the single mean shift that most reduces the squared error,
+#     found for every series and every split at once from cumulative sums, and
+#     kept when the reduction beats a BIC-style penalty k * sigma^2 * log(n),
+#     with sigma^2 the residual variance after the split
+#
+# Thresholds are calibrated against pure noise rather than fixed: with 8 or 9
+# quarters per series the MAD and the residual variance are themselves noisy,
+# so the textbook z > 3.5 flagged ~15% and a fixed k ~10% of white-noise
+# series. Both statistics are location- and scale-free, so their distribution
+# on Gaussian white noise depends only on the series length; the z threshold
+# and k for each length are the quantiles that flag NULL_FALSE_POSITIVE_RATE
+# of NULL_SIMULATIONS simulated noise series (seeded, computed once per length).
+
+ANOMALIES_FILE = 'wait_time_anomalies.csv'
+CHANGEPOINTS_FILE = 'wait_time_changepoints.csv'
+
+SERIES_KEYS = ['Facility', 'Procedure', 'Metric']
+METRICS = ['Surgery_Median', 'Surgery_90th']
+
+MIN_SEGMENT = 2
+NULL_FALSE_POSITIVE_RATE = 0.01  # share of white-noise series flagged, per detector
+NULL_SIMULATIONS = 20_000
+NULL_SEED = 0
+
+
+def quarter_index(year, quarter):
+    """Consecutive integer per quarter, so gaps and ordering are preserved"""
+    return (year * 4 + quarter - 1).astype(int)
+
+
+def quarter_label(index):
+    return f"{int(index) // 4}_q{int(index) % 4 + 1}"
+
+
+def facility_series(cihi_clean, quarter_pattern=r'^\d{4}_q\d$'):
+    """Long table of quarterly values per Facility x Procedure x Metric"""
+    quarterly = cihi_clean[cihi_clean['Period'].str.match(quarter_pattern) & cihi_clean['Facility'].notna()]
+    quarterly = quarterly.dropna(subset=['Year', 'Quarter'])
+    long = quarterly.melt(id_vars=['Facility', 'Procedure', 'Year', 'Quarter'],
+                          value_vars=METRICS, var_name='Metric', value_name='Value')
+    long['Value'] = pd.to_numeric(long['Value'], errors='coerce')
+    long['Quarter_Index'] = quarter_index(long['Year'], long['Quarter'])
+    return long.dropna(subset=['Value'])[SERIES_KEYS + ['Quarter_Index', 'Value']]
+
+
+def robust_z_scores(values, lengths):
+    """Modified z-score for every cell of a padded (n_series, max_len) matrix"""
+    with warnings.catch_warnings(), np.errstate(invalid='ignore', divide='ignore'):
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN padding rows
+        median = np.nanmedian(values, axis=1, keepdims=True)
+        deviation = np.abs(values - median)
+        mad = np.nanmedian(deviation, axis=1, keepdims=True)
+        # Fall back to the mean absolute deviation when more than half the values tie
+        meanad = np.nanmean(deviation, axis=1, keepdims=True)
+        z = np.where(mad > 0, 0.6745 * (values - median) / mad, (values - median) / (1.2533 * meanad))
+    return np.where(np.isfinite(z), z, 0.0)
+
+
+def _best_split(values, lengths, min_segment):
+    """Best single mean-shift split per row: (index, SSE reduction, residual variance)"""
+    n_series, max_len = values.shape
+    filled = np.where(np.isnan(values), 0.0, values)
+    csum = np.cumsum(filled, axis=1)
+    total = csum[np.arange(n_series), np.maximum(lengths - 1, 0)][:, None]
+
+    k = np.arange(1, max_len + 1)[None, :].astype(float)  # size of the left segment
+    n = lengths[:, None].astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # SSE reduction of splitting after k values: k(n-k)/n * (mean_left - mean_right)^2
+        gain = (csum ** 2 / k + (total - csum) ** 2 / (n - k) - total ** 2 / n)
+    allowed = (k >= min_segment) & (k <= n - min_segment)
+    gain = np.where(allowed & np.isfinite(gain), gain, -np.inf)
+
+    best = np.argmax(gain, axis=1)
+    best_gain = gain[np.arange(n_series), best]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sse = (filled ** 2).sum(axis=1) - total[:, 0] ** 2 / lengths
+        noise_var = (sse - best_gain) / (lengths - 2)
+    noise_var = np.where(np.isfinite(noise_var) & (noise_var > 0), noise_var, np.nan)
+    return best, best_gain, noise_var
+
+
+@functools.lru_cache(maxsize=None)
+def null_critical_values(length, min_segment=MIN_SEGMENT, false_positive_rate=NULL_FALSE_POSITIVE_RATE):
+    """
+    (z threshold, changepoint k) for series of the given length.
+
+    Each is the (1 - false_positive_rate) quantile of its statistic over
+    NULL_SIMULATIONS Gaussian white-noise series: the largest |robust z| of a
+    series, and the best split's gain / (sigma^2 * log n).
+    """
+    rng = np.random.default_rng([NULL_SEED, length])
+    noise = rng.standard_normal((NULL_SIMULATIONS, length))
+    lengths = np.full(NULL_SIMULATIONS, length)
+    max_z = np.abs(robust_z_scores(noise, lengths)).max(axis=1)
+
+    _, gain, noise_var = _best_split(noise, lengths, min_segment)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        statistic = gain / (noise_var * np.log(max(length, 2)))
+    # Too short to split: no changepoint can be flagged
+    statistic = np.where(np.isfinite(statistic), statistic, np.inf)
+    quantile = 1 - false_positive_rate
+    return float(np.quantile(max_z, quantile)), float(np.quantile(statistic, quantile))
+
+
+def critical_values(lengths, min_segment=MIN_SEGMENT, false_positive_rate=NULL_FALSE_POSITIVE_RATE):
+    """Per-series arrays (z threshold, changepoint k) for the given series lengths"""
+    unique, inverse = np.unique(lengths, return_inverse=True)
+    table = np.array([null_critical_values(int(length), min_segment, false_positive_rate)
+                      for length in unique]).reshape(-1, 2)
+    return table[inverse, 0], table[inverse, 1]
+
+
+def mean_shift_changepoints(values, lengths, min_segment=MIN_SEGMENT, false_positive_rate=NULL_FALSE_POSITIVE_RATE):
+    """
+    Best single mean-shift split per row of a padded matrix.
+
+    Returns (split, gain, score): split is the index of the first value after
+    the change (-1 where none qualifies), gain the reduction in squared error
+    and score the gain relative to the penalty (> 1 means significant).
+    """
+    best, best_gain, noise_var = _best_split(values, lengths, min_segment)
+    _, penalty = critical_values(lengths, min_segment, false_positive_rate)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        score = best_gain / (penalty * np.log(np.maximum(lengths, 2)) * noise_var)
+    score = np.where(np.isfinite(score), score, 0.0)
+    split = np.where(score > 1, best + 1, -1)
+    return split, np.where(np.isfinite(best_gain), best_gain, 0.0), score
+
+
+def detect_anomalies(series):
+    """Flagged outlier quarters with their robust z-scores"""
+    keys, values, times, lengths = build_series_matrix(series, SERIES_KEYS, 'Value', 'Quarter_Index')
+    z = robust_z_scores(values, lengths)
+    threshold, _ = critical_values(lengths)
+    rows, cols = np.nonzero((np.abs(z) > threshold[:, None]) & ~np.isnan(values))
+
+    anomalies = keys.iloc[rows].reset_index(drop=True)
+    anomalies['Period'] = [quarter_label(t) for t in times[rows, cols]]
+    anomalies['Value'] = values[rows, cols]
+    anomalies['Series_Median'] = np.nanmedian(values[rows], axis=1) if len(rows) else []
+    anomalies['Robust_Z'] = z[rows, cols].round(2)
+    return anomalies.sort_values('Robust_Z', key=np.abs, ascending=False, ignore_index=True)
+
+
+def detect_changepoints(series):
+    """Series with a significant mean shift, with the levels before and after"""
+    keys, values, times, lengths = build_series_matrix(series, SERIES_KEYS, 'Value', 'Quarter_Index')
+    split, gain, score = mean_shift_changepoints(values, lengths)
+    rows = np.nonzero(split > 0)[0]
+
+    cols = np.arange(values.shape[1])[None, :]
+    before = (cols < split[rows, None]) & (cols < lengths[rows, None])
+    after = (cols >= split[rows, None]) & (cols < lengths[rows, None])
+    filled = np.where(np.isnan(values[rows]), 0.0, values[rows])
+
+    changepoints = keys.iloc[rows].reset_index(drop=True)
+    changepoints['Changepoint_Period'] = [quarter_label(t) for t in times[rows, split[rows]]]
+    changepoints['Mean_Before'] = (filled * before).sum(axis=1) / before.sum(axis=1)
+    changepoints['Mean_After'] = (filled * after).sum(axis=1) / after.sum(axis=1)
+    changepoints['Shift_Days'] = changepoints['Mean_After'] - changepoints['Mean_Before']
+    changepoints['Score'] = score[rows].round(2)
+    return changepoints.sort_values('Score', ascending=False, ignore_index=True)
+
+
+if __name__ == "__main__":
+    import time
+
+    from final_merge_script import CIHI_FILE, load_cihi
+
+    print("=== ANOMALY AND CHANGEPOINT DETECTION ===\n")
+    series = facility_series(load_cihi(CIHI_FILE))
+    start = time.perf_counter()
+    anomalies = detect_anomalies(series)
+    changepoints = detect_changepoints(series)
+    n_series = series[SERIES_KEYS].drop_duplicates().shape[0]
+    print(f"{n_series} series scanned in {time.perf_counter() - start:.3f}s")
+    print(f"\n{len(anomalies)} outlier quarters:")
+    print(anomalies.head(10))
+    print(f"\n{len(changepoints)} changepoints:")
+    print(changepoints.head(10))
@@ -0,0 +1,210 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Batched bootstrap confidence intervals for many wait time series at once.
+#
+# Every series is packed into one row of a padded matrix (valid values first,
+# NaN after). Resampling draws an index matrix per chunk of series and reduces
+# along the last axis, so there is no Python loop per series or per resample.
+# Series are processed in chunks sized to a memory budget, and chunks are
+# spread across worker processes. Each chunk gets its own child seed derived
+# from (seed, chunk start), so results do not depend on the number of workers.
+
+# Same windows as the "Recent 5Y Avg" / "Previous 5Y Avg" summary statistics
+RECENT_START = 2020
+PREVIOUS_END = 2014
+
+
+def build_series_matrix(df, keys, value_col, time_col):
+    """
+    Pack a long table into a padded (n_series, max_len) matrix.
+
+    Returns (series_keys, values, times, lengths) where series_keys is a
+    DataFrame with one row per series in matrix order.
+    """
+    data = df.dropna(subset=[value_col, time_col])
+    data = data.sort_values(keys + [time_col])
+
+    grouped = data.groupby(keys, sort=False, dropna=False)
+    series_id = grouped.ngroup().to_numpy()
+    position = grouped.cumcount().to_numpy()
+
+    n_series = int(series_id.max()) + 1 if len(series_id) else 0
+    lengths = np.bincount(series_id, minlength=n_series)
+    max_len = int(lengths.max()) if n_series else 0
+
+    values = np.full((n_series, max_len), np.nan)
+    times = np.full((n_series, max_len), np.nan)
+    values[series_id, position] = data[value_col].to_numpy(dtype=float)
+    times[series_id, position] = data[time_col].to_numpy(dtype=float)
+
+    series_keys = data[keys].iloc[np.unique(series_id, return_index=True)[1]].reset_index(drop=True)
+    return series_keys, values, times, lengths
+
+
+def _compact(values, mask):
+    """Move the entries selected by mask to the front of each row and trim the padding"""
+    order = np.argsort(~mask, axis=1, kind='stable')
+    packed = np.take_along_axis(np.where(mask, values, np.nan), order, axis=1)
+    lengths = mask.sum(axis=1)
+    width = int(lengths.max()) if len(lengths) else 0
+    return packed[:, :max(width, 1)], lengths
+
+
+def _resample(values, lengths, n_resamples, rng):
+    """Draw (s, b, L) bootstrap samples; positions past each row's length are masked out"""
+    s, max_len = values.shape
+    upper = np.maximum(lengths, 1)[:, None, None]
+    idx = (rng.random((s, n_resamples, max_len)) * upper).astype(np.intp)
+    # Gather through flat offsets; much cheaper than 3-D fancy indexing
+    idx += (np.arange(s) * max_len)[:, None, None]
+    samples = values.ravel().take(idx)
+    valid = np.arange(max_len)[None, None, :] < lengths[:, None, None]
+    return samples, valid
+
+
+def _mean(samples, valid, lengths):
+    total = np.where(valid, samples, 0.0).sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return total / lengths[:, None]
+
+
+def _median(samples, valid, lengths):
+    ordered = np.sort(np.where(valid, samples, np.inf), axis=-1)
+    lo = np.clip((lengths - 1) // 2, 0, None)[:, None, None]
+    hi = np.clip(lengths // 2, 0, None)[:, None, None]
+    lo_vals = np.take_along_axis(ordered, np.broadcast_to(lo, ordered.shape[:2] + (1,)), axis=-1)[..., 0]
+    hi_vals = np.take_along_axis(ordered, np.broadcast_to(hi, ordered.shape[:2] + (1,)), axis=-1)[..., 0]
+    result = (lo_vals + hi_vals) / 2
+    result[lengths == 0] = np.nan
+    return result
+
+
+def _bootstrap_chunk(values, lengths, prev_values, prev_lengths, recent_values, recent_lengths,
+                     n_resamples, batch, quantiles, seed_entropy):
+    """Bootstrap one chunk of series; returns {statistic: (low, high)} arrays"""
+    rng = np.random.default_rng(np.random.SeedSequence(seed_entropy))
+    s = values.shape[0]
+    boot = {name: np.empty((s, n_resamples)) for name in ('Mean', 'Median', 'Change', 'Percent Change')}
+
+    for start in range(0, n_resamples, batch):
+        b = min(batch, n_resamples - start)
+        cols = slice(start, start + b)
+
+        samples, valid = _resample(values, lengths, b, rng)
+        boot['Mean'][:, cols] = _mean(samples, valid, lengths)
+        boot['Median'][:, cols] = _median(samples, valid, lengths)
+
+        # Period-over-period change: resample each window independently
+        samples, valid = _resample(prev_values, prev_lengths, b, rng)
+        prev_mean = _mean(samples, valid, prev_lengths)
+        samples, valid = _resample(recent_values, recent_lengths, b, rng)
+        recent_mean = _mean(samples, valid, recent_lengths)
+        boot['Change'][:, cols] = recent_mean - prev_mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            boot['Percent Change'][:, cols] = (recent_mean - prev_mean) / prev_mean * 100
+
+    # Series whose statistic is undefined in some resample (empty window, zero
+    # baseline) get no interval; a plain quantile plus a row mask avoids
+    # nanquantile's slow per-row path
+    bounds = {}
+    for name, stats in boot.items():
+        undefined = ~np.isfinite(stats).all(axis=1)
+        low, high = np.quantile(np.where(undefined[:, None], 0.0, stats), quantiles, axis=1)
+        low[undefined] = np.nan
+        high[undefined] = np.nan
+        bounds[name] = (low, high)
+    return bounds
+
+
+def _point_estimates(values, lengths, prev_values, prev_lengths, recent_values, recent_lengths):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nansum(values, axis=1) / lengths
+        prev_mean = np.nansum(prev_values, axis=1) / prev_lengths
+        recent_mean = np.nansum(recent_values, axis=1) / recent_lengths
+        return {
+            'Mean': mean,
+            'Median': _median(values[:, None, :], ~np.isnan(values)[:, None, :], lengths)[:, 0],
+            'Change': recent_mean - prev_mean,
+            'Percent Change': (recent_mean - prev_mean) / prev_mean * 100,
+        }
+
+
+def bootstrap_series(df, keys, value_col, time_col, n_resamples=10000, confidence=0.95, seed=42,
+                     recent_start=RECENT_START, previous_end=PREVIOUS_END,
+                     max_chunk_mb=64, n_jobs=None):
+    """
+    Percentile bootstrap CIs for the mean, median and recent-vs-previous
+    change of every series in df (one series per unique combination of keys).
+
+    Returns a long DataFrame with the key columns plus Statistic, Estimate,
+    CI_Low, CI_High and N (number of observations in the series).
+    """
+    series_keys, values, times, lengths = build_series_matrix(df, keys, value_col, time_col)
+    valid = ~np.isnan(values)
+    prev_values, prev_lengths = _compact(values, valid & (times <= previous_end))
+    recent_values, recent_lengths = _compact(values, valid & (times >= recent_start))
+
+    n_series, max_len = values.shape
+    alpha = (1 - confidence) / 2
+    quantiles = [alpha, 1 - alpha]
+
+    # Size chunks so one (series, resamples, max_len) draw stays under budget
+    cell_bytes = 48 * max(max_len, 1)  # draws, indices, samples and temporaries per resample
+    batch = max(1, min(n_resamples, (max_chunk_mb << 20) // (cell_bytes * 64)))
+    chunk = max(1, (max_chunk_mb << 20) // (cell_bytes * batch))
+
+    starts = list(range(0, n_series, chunk))
+    jobs = [
+        (values[i:i + chunk], lengths[i:i + chunk],
+         prev_values[i:i + chunk], prev_lengths[i:i + chunk],
+         recent_values[i:i + chunk], recent_lengths[i:i + chunk],
+         n_resamples, batch, quantiles, (seed, i))
+        for i in starts
+    ]
+
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(jobs))) as pool:
+            chunks = list(pool.map(_bootstrap_chunk, *zip(*jobs)))
+    else:
+        chunks = [_bootstrap_chunk(*job) for job in jobs]
+
+    estimates = _point_estimates(values, lengths, prev_values, prev_lengths, recent_values, recent_lengths)
+    counts = {'Mean': lengths, 'Median': lengths,
+              'Change': np.minimum(prev_lengths, recent_lengths),
+              'Percent Change': np.minimum(prev_lengths, recent_lengths)}
+
+    frames = []
+    for name, estimate in estimates.items():
+        low = np.concatenate([c[name][0] for c in chunks]) if chunks else np.empty(0)
+        high = np.concatenate([c[name][1] for c in chunks]) if chunks else np.empty(0)
+        frame = series_keys.copy()
+        frame['Statistic'] = name
+        frame['Estimate'] = estimate
+        frame['CI_Low'] = low
+        frame['CI_High'] = high
+        frame['N'] = counts[name]
+        frames.append(frame)
+
+    result = pd.concat(frames, ignore_index=True)
+    # A single observation has no sampling variability to speak of
+    result.loc[result['N'] < 2, ['CI_Low', 'CI_High']] = np.nan
+    return result
+
+
+if __name__ == "__main__":
+    import time
+
+    from final_merge_script import FRASER_FILE, FRASER_RESULT_COL, FRASER_YEAR_COL, load_fraser
+
+    print("=== BOOTSTRAP CONFIDENCE INTERVALS ===\n")
+    fraser = load_fraser(FRASER_FILE)
+    start = time.perf_counter()
+    ci = bootstrap_series(fraser, ['Province', 'Region', 'Indicator', 'Metric'],
+                          FRASER_RESULT_COL, FRASER_YEAR_COL)
+    print(f"{ci['Statistic'].eq('Mean').sum()} series bootstrapped in {time.perf_counter() - start:.2f}s")
+    print(ci[ci['Province'] == 'Nova Scotia'].head(20))
@@ -0,0 +1,164 @@
+import re
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+
+# Reader for CIHI Surgical_Wait_Times.csv extracts.
+#
+# Parsing is done by Arrow's multi-threaded CSV reader with an explicit
+# schema, instead of pandas' type inference:
+#   - Provider holds quoted "Last, First" names; standard double-quote
+#     quoting keeps them in one field
+#   - the UTF-8 byte order mark before the first header is skipped
+#   - only empty fields are missing values; Specialty/Provider/Zone/Facility
+#     are often empty, and "NA" or "n/a" in a label is kept as text
+#   - wait times above 999 days carry a thousands separator ("1,342"), so
+#     numeric columns are read as text, stripped of separators and converted
+#     in Arrow; a value that is still not a number becomes missing and is
+#     counted per column
+#   - only the requested columns are converted (projection)
+# Lines with the wrong number of fields are skipped by the parser but
+# recorded, never dropped silently: the returned DataFrame has
+# attrs['malformed_lines'] (line number, field count and text of each) and
+# attrs['invalid_values'] ({column: count}).
+
+TEXT_COLUMNS = ['Period', 'Specialty', 'Procedure', 'Provider', 'Zone', 'Facility']
+NUMERIC_COLUMNS = ['Year', 'Quarter', 'Consult_Median', 'Consult_90th', 'Surgery_Median', 'Surgery_90th']
+CIHI_COLUMNS = TEXT_COLUMNS + NUMERIC_COLUMNS
+
+BLOCK_SIZE = 4 << 20
+NUMBER_PATTERN = r'^[-+]?(\d+(\.\d*)?|\.\d+)$'
+
+
+def _locate(path, texts):
+    """Line numbers of the given raw lines (only needed when some were malformed)"""
+    wanted = {}
+    for text in texts:
+        wanted.setdefault(text, [])
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        for number, line in enumerate(f, start=1):
+            line = line.rstrip('\r\n')
+            if line in wanted:
+                wanted[line].append(number)
+    # The same bad text can appear on several lines; hand them out in order
+    return [wanted[text].pop(0) if wanted[text] else None for text in texts]
+
+
+def _to_number(column):
+    """float64 column from text with thousands separators; returns (values, invalid count)"""
+    # Fast paths first: most columns are plain numbers, a few have separators
+    try:
+        return pc.cast(column, pa.float64()), 0
+    except pa.ArrowInvalid:
+        pass
+    cleaned = pc.replace_substring(column, ',', '')
+    try:
+        return pc.cast(cleaned, pa.float64()), 0
+    except pa.ArrowInvalid:
+        pass
+    cleaned = pc.utf8_trim_whitespace(cleaned)
+    valid = pc.match_substring_regex(cleaned, NUMBER_PATTERN)
+    values = pc.cast(pc.if_else(valid, cleaned, pa.scalar(None, pa.string())), pa.float64())
+    return values, pc.sum(pc.invert(valid)).as_py() or 0
+
+
+def read_cihi(path, columns=None, use_threads=True):
+    """
+    Read a CIHI extract into a DataFrame with the CIHI_COLUMNS schema.
+
+    columns selects a subset (returned in CIHI_COLUMNS order); the file
+    must have every selected column. Text columns come back as strings, numeric
+    columns as float64.
+    """
+    columns = CIHI_COLUMNS if columns is None else [c for c in CIHI_COLUMNS if c in columns]
+    malformed = []
+
+    def skip_row(row):
+        malformed.append({'fields': row.actual_columns, 'text': row.text})
+        return 'skip'
+
+    table = pv.read_csv(
+        path,
+        read_options=pv.ReadOptions(use_threads=use_threads, block_size=BLOCK_SIZE),
+        parse_options=pv.ParseOptions(quote_char='"', double_quote=True, newlines_in_values=False,
+                                      invalid_row_handler=skip_row),
+        convert_options=pv.ConvertOptions(
+            include_columns=columns,
+            column_types={column: pa.string() for column in columns},
+            null_values=[''],
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=True,
+        ),
+    )
+
+    invalid_values = {}
+    for column in columns:
+        if column in NUMERIC_COLUMNS:
+            values, invalid = _to_number(table[column])
+            table = table.set_column(table.schema.get_field_index(column), column, values)
+            if invalid:
+                invalid_values[column] = invalid
+
+    # Arrow does not know line numbers when parsing in parallel
+    for problem, line in zip(malformed, _locate(path, [problem['text'] for problem in malformed])):
+        problem['line'] = line
+
+    df = table.to_pandas()
+    df.attrs['malformed_lines'] = sorted(malformed, key=lambda problem: problem['line'] or 0)
+    df.attrs['invalid_values'] = invalid_values
+    return df
+
+
+def describe_problems(df, limit=10):
+    """Printable lines for the malformed lines and unparseable values found by read_cihi"""
+    malformed = df.attrs.get('malformed_lines', [])
+    lines = []
+    if malformed:
+        lines.append(f"{len(malformed)} malformed line(s) skipped (expected {len(CIHI_COLUMNS)} fields):")
+        for problem in malformed[:limit]:
+            text = re.sub(r'\s+', ' ', problem['text'])[:100]
+            lines.append(f"  line {problem['line']}: {problem['fields']} fields: {text}")
+        if len(malformed) > limit:
+            lines.append(f"  ... and {len(malformed) - limit} more")
+    for column, count in df.attrs.get('invalid_values', {}).items():
+        lines.append(f"{count} non-numeric value(s) in {column} read as missing")
+    return lines
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+    import tempfile
+    import time
+
+    import pandas as pd
+
+    from final_merge_script import CIHI_FILE
+
+    print("=== CIHI READER ===\n")
+    path = sys.argv[1] if len(sys.argv) > 1 else CIHI_FILE
+    cihi = read_cihi(path)
+    print(f"{path}: {len(cihi)} rows, {len(cihi.attrs['malformed_lines'])} malformed lines")
+    for line in describe_problems(cihi):
+        print(line)
+
+    # A national-sized extract: the local one repeated
+    copies = 200
+    with open(path, 'rb') as f:
+        header, body = f.read().split(b'\n', 1)
+    body = body if body.endswith(b'\n') else body + b'\n'
+    with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as f:
+        f.write(header + b'\n' + body * copies)
+        national = f.name
+    try:
+        start = time.perf_counter()
+        pandas_rows = len(pd.read_csv(national, thousands=','))
+        pandas_time = time.perf_counter() - start
+        start = time.perf_counter()
+        arrow_rows = len(read_cihi(national))
+        arrow_time = time.perf_counter() - start
+    finally:
+        os.remove(national)
+    print(f"\n{copies}x extract: pandas {pandas_rows} rows in {pandas_time:.2f}s, "
+          f"read_cihi {arrow_rows} rows in {arrow_time:.2f}s ({pandas_time / arrow_time:.1f}x)")
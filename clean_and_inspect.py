@@ -1,12 +1,14 @@
 import pandas as pd
 import numpy as np
 
+from cihi_reader import read_cihi
+
 print("=== DETAILED DATA INSPECTION AND CLEANING ===\n")
 
 # 1. CIHI Data (CSV)
 print("1. CIHI SURGICAL WAIT TIMES DATA")
 print("-" * 50)
-cihi_df = pd.read_csv('Surgical_Wait_Times.csv')
+cihi_df = read_cihi('Surgical_Wait_Times.csv')
 print(f"Shape: {cihi_df.shape}")
 print(f"Columns: {list(cihi_df.columns)}")
 
@@ -7,6 +7,9 @@ from plotly.subplots import make_subplots
 import numpy as np
 from datetime import datetime
 
+from bootstrap_stats import bootstrap_series
+from figure_templates import FigureTemplate
+
 # Set style for better visualizations
 plt.style.use('seaborn-v0_8')
 sns.set_palette("husl")
@@ -27,12 +30,9 @@ print(f"Available data sources:")
 print(f"- Fraser Institute: {df['Fraser_Wait_Time_Days'].notna().sum()} years")
 print(f"- CIHI: {df['CIHI_Surgery_Median_Days'].notna().sum()} years")
 
-# Create comprehensive dashboard
-def create_dashboard():
-    """Create a comprehensive dashboard with multiple visualizations"""
-    
-    # 1. Time Series Analysis
-    fig1 = make_subplots(
+# Figure templates: the styling is built once, the charts below only supply data arrays
+def overview_template():
+    fig = make_subplots(
         rows=2, cols=2,
         subplot_titles=('Fraser Institute Wait Times (2008-2024)', 
                        'Wait Time Trends by Decade',
@@ -41,53 +41,67 @@ def create_dashboard():
         specs=[[{"secondary_y": False}, {"secondary_y": False}],
                [{"secondary_y": False}, {"secondary_y": False}]]
     )
-    
-    # Fraser Institute wait times
-    fraser_data = df.dropna(subset=['Fraser_Wait_Time_Days'])
-    fig1.add_trace(
-        go.Scatter(x=fraser_data['Year'], y=fraser_data['Fraser_Wait_Time_Days'],
-                  mode='lines+markers', name='Fraser Institute',
-                  line=dict(color='blue', width=3),
-                  marker=dict(size=8)),
+    fig.add_trace(
+        go.Scatter(mode='lines+markers', name='Fraser Institute',
+                   line=dict(color='blue', width=3),
+                   marker=dict(size=8)),
         row=1, col=1
     )
-    
-    # Add trend line
-    z = np.polyfit(fraser_data['Year'], fraser_data['Fraser_Wait_Time_Days'], 1)
-    p = np.poly1d(z)
-    fig1.add_trace(
-        go.Scatter(x=fraser_data['Year'], y=p(fraser_data['Year']),
-                  mode='lines', name='Trend Line',
-                  line=dict(color='red', width=2, dash='dash')),
+    fig.add_trace(
+        go.Scatter(mode='lines', name='Trend Line',
+                   line=dict(color='red', width=2, dash='dash')),
         row=1, col=1
     )
+    fig.add_trace(go.Bar(name='Decade Average', marker_color='lightblue'), row=1, col=2)
+    fig.add_trace(go.Bar(name='Year-over-Year Change', marker_color='orange'), row=2, col=1)
+    fig.add_trace(go.Bar(name='Data Sources Available', marker_color='green'), row=2, col=2)
+    fig.update_layout(height=800, title_text="Nova Scotia Healthcare Wait Times Analysis")
+    return FigureTemplate(fig, ['fraser', 'trend', 'decade', 'yoy', 'availability'])
+
+
+def comparison_template():
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(mode='lines+markers', name='Fraser Institute', line=dict(color='blue', width=3)))
+    fig.add_trace(go.Scatter(mode='lines+markers', name='CIHI', line=dict(color='red', width=3)))
+    fig.update_layout(
+        title="Wait Time Comparison: Fraser Institute vs CIHI",
+        xaxis_title="Year",
+        yaxis_title="Wait Time (Days)",
+        height=500
+    )
+    return FigureTemplate(fig, ['fraser', 'cihi'])
+
+
+# Create comprehensive dashboard
+def create_dashboard():
+    """Create a comprehensive dashboard with multiple visualizations"""
     
+    # 1. Time Series Analysis
+    fraser_data = df.dropna(subset=['Fraser_Wait_Time_Days'])
+    years = fraser_data['Year'].to_numpy()
+    days = fraser_data['Fraser_Wait_Time_Days'].to_numpy()
+
+    # Add trend line
+    z = np.polyfit(years, days, 1)
+    p = np.poly1d(z)
+
     # Decade analysis
     fraser_data['Decade'] = (fraser_data['Year'] // 10) * 10
     decade_avg = fraser_data.groupby('Decade')['Fraser_Wait_Time_Days'].mean().reset_index()
-    fig1.add_trace(
-        go.Bar(x=decade_avg['Decade'], y=decade_avg['Fraser_Wait_Time_Days'],
-               name='Decade Average', marker_color='lightblue'),
-        row=1, col=2
-    )
-    
+
     # Year-over-year changes
     fraser_data['YoY_Change'] = fraser_data['Fraser_Wait_Time_Days'].diff()
-    fig1.add_trace(
-        go.Bar(x=fraser_data['Year'][1:], y=fraser_data['YoY_Change'][1:],
-               name='Year-over-Year Change', marker_color='orange'),
-        row=2, col=1
-    )
-    
+
     # Data availability
     availability = df[['Year', 'Fraser_Wait_Time_Days', 'CIHI_Surgery_Median_Days']].notna().sum(axis=1)
-    fig1.add_trace(
-        go.Bar(x=df['Year'], y=availability,
-               name='Data Sources Available', marker_color='green'),
-        row=2, col=2
-    )
-    
-    fig1.update_layout(height=800, title_text="Nova Scotia Healthcare Wait Times Analysis")
+
+    fig1 = overview_template().render({
+        'fraser': {'x': years, 'y': days},
+        'trend': {'x': years, 'y': p(years)},
+        'decade': {'x': decade_avg['Decade'].to_numpy(), 'y': decade_avg['Fraser_Wait_Time_Days'].to_numpy()},
+        'yoy': {'x': years[1:], 'y': fraser_data['YoY_Change'].to_numpy()[1:]},
+        'availability': {'x': df['Year'].to_numpy(), 'y': availability.to_numpy()},
+    })
     fig1.show()
     
     # 2. Statistical Summary
@@ -113,28 +127,12 @@ def create_dashboard():
     
     # 4. Create comparison chart (if CIHI data becomes available)
     if df['CIHI_Surgery_Median_Days'].notna().any():
-        fig2 = go.Figure()
-        
         cihi_data = df.dropna(subset=['CIHI_Surgery_Median_Days'])
-        
-        fig2.add_trace(go.Scatter(
-            x=fraser_data['Year'], y=fraser_data['Fraser_Wait_Time_Days'],
-            mode='lines+markers', name='Fraser Institute',
-            line=dict(color='blue', width=3)
-        ))
-        
-        fig2.add_trace(go.Scatter(
-            x=cihi_data['Year'], y=cihi_data['CIHI_Surgery_Median_Days'],
-            mode='lines+markers', name='CIHI',
-            line=dict(color='red', width=3)
-        ))
-        
-        fig2.update_layout(
-            title="Wait Time Comparison: Fraser Institute vs CIHI",
-            xaxis_title="Year",
-            yaxis_title="Wait Time (Days)",
-            height=500
-        )
+
+        fig2 = comparison_template().render({
+            'fraser': {'x': years, 'y': days},
+            'cihi': {'x': cihi_data['Year'].to_numpy(), 'y': cihi_data['CIHI_Surgery_Median_Days'].to_numpy()},
+        })
         fig2.show()
     
     # 5. Save summary statistics
@@ -152,6 +150,23 @@ def create_dashboard():
     }
     
     summary_df = pd.DataFrame(summary_stats)
+
+    # Bootstrap 95% confidence intervals for the estimates that have one
+    ci = bootstrap_series(fraser_data.assign(Series='Fraser'), ['Series'],
+                          'Fraser_Wait_Time_Days', 'Year', n_jobs=1).set_index('Statistic')
+    summary_df = pd.concat([summary_df, pd.DataFrame({
+        'Metric': ['Recent vs Previous Change', 'Recent vs Previous Change (%)'],
+        'Value': [ci.loc['Change', 'Estimate'], ci.loc['Percent Change', 'Estimate']]
+    })], ignore_index=True)
+    ci_rows = {'Mean': 'Mean', 'Median': 'Median',
+               'Recent vs Previous Change': 'Change',
+               'Recent vs Previous Change (%)': 'Percent Change'}
+    summary_df['CI_Low'] = summary_df['Metric'].map(lambda m: ci.loc[ci_rows[m], 'CI_Low'] if m in ci_rows else np.nan)
+    summary_df['CI_High'] = summary_df['Metric'].map(lambda m: ci.loc[ci_rows[m], 'CI_High'] if m in ci_rows else np.nan)
+
+    print("\n95% bootstrap confidence intervals:")
+    for metric, stat in ci_rows.items():
+        print(f"{metric}: {ci.loc[stat, 'Estimate']:.1f} ({ci.loc[stat, 'CI_Low']:.1f} to {ci.loc[stat, 'CI_High']:.1f})")
     summary_df.to_csv('wait_times_summary_stats.csv', index=False)
     print(f"\nSummary statistics saved to 'wait_times_summary_stats.csv'")
 
@@ -0,0 +1,191 @@
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+from publish import atomic_write_workbook
+
+# Multi-sheet xlsx report for stakeholders, laid out like the Fraser tables.
+#
+# The Summary, By Province and By Procedure tables are small aggregates built
+# in the pipeline's report stage right before writing; the pipeline keeps the
+# workbook bytes and publishes them with the other outputs (see publish.py).
+# The workbook is written with xlsxwriter in constant_memory mode: each row is
+# flushed to the sheet's temporary XML once the next row starts and strings
+# are stored inline, so memory does not grow with the number of raw rows. Raw
+# rows are converted to cell values ROW_CHUNK rows at a time instead of the
+# whole table at once, and tables longer than an Excel sheet continue on
+# numbered sheets.
+
+REPORT_FILE = 'wait_times_report.xlsx'
+
+MAX_SHEET_ROWS = 1_048_576  # Excel's limit, header row included
+ROW_CHUNK = 10_000
+MAX_COLUMN_WIDTH = 50
+# Labels are data: never turn a value starting with '=' into a formula or a URL-like one into a link
+WORKBOOK_OPTIONS = {'constant_memory': True, 'strings_to_formulas': False, 'strings_to_urls': False}
+
+FRASER_METRIC_COLUMNS = {
+    '50th Percentile': 'Median_Days',
+    '90th Percentile': '90th_Days',
+    'Volume': 'Volume',
+    '% Meeting Benchmark': 'Pct_Meeting_Benchmark',
+}
+CIHI_VALUE_COLUMNS = ['Consult_Median', 'Consult_90th', 'Surgery_Median', 'Surgery_90th']
+
+
+def summary_sheet(cihi_clean, fraser_clean, year_col, comparison):
+    """Headline figures as Item/Value rows"""
+    quarters = cihi_clean.dropna(subset=['Year', 'Quarter']).sort_values(['Year', 'Quarter'])['Period']
+    items = [
+        ('CIHI rows', len(cihi_clean)),
+        ('CIHI quarters', f"{quarters.iloc[0]} to {quarters.iloc[-1]}" if len(quarters) else None),
+        ('CIHI procedures', cihi_clean['Procedure'].nunique()),
+        ('CIHI facilities', cihi_clean['Facility'].nunique()),
+        ('CIHI providers', cihi_clean['Provider'].nunique()),
+    ]
+    if fraser_clean is not None:
+        years = fraser_clean[year_col].dropna()
+        items += [
+            ('Fraser rows', len(fraser_clean)),
+            ('Fraser years', f"{int(years.min())} to {int(years.max())}" if len(years) else None),
+            ('Fraser provinces', fraser_clean['Province'].nunique()),
+            ('Fraser indicators', fraser_clean['Indicator'].nunique()),
+        ]
+    if comparison is not None and not comparison.empty:
+        items += [
+            ('Procedure-years in both sources', len(comparison)),
+            ('CIHI vs Fraser median correlation',
+             round(comparison['CIHI_Surgery_Median_Days'].corr(comparison['Fraser_Median_Days']), 3)),
+            ('Average difference (days)', round(comparison['Difference_Days'].mean(), 1)),
+            ('Average percent difference', round(comparison['Percent_Difference'].mean(), 1)),
+        ]
+    return pd.DataFrame(items, columns=['Item', 'Value'])
+
+
+def province_sheet(fraser_clean, year_col, value_col):
+    """Latest year of every provincial Fraser indicator, one row per Province x Indicator"""
+    if fraser_clean is None:
+        return None
+    provincial = fraser_clean[fraser_clean['Reporting level'] == 'Provincial'].dropna(subset=[year_col, value_col])
+    wide = provincial.pivot_table(index=['Province', 'Indicator', year_col], columns='Metric',
+                                  values=value_col, aggfunc='mean')
+    wide = wide.rename(columns=FRASER_METRIC_COLUMNS).reset_index()
+    wide.columns.name = None
+    for column in FRASER_METRIC_COLUMNS.values():
+        if column not in wide:
+            wide[column] = np.nan
+
+    by_series = wide.sort_values(year_col).groupby(['Province', 'Indicator'])
+    latest = by_series.tail(1).set_index(['Province', 'Indicator'])
+    previous = by_series.nth(-2).set_index(['Province', 'Indicator'])
+    table = pd.DataFrame({
+        'First_Year': by_series[year_col].min(),
+        'Latest_Year': latest[year_col],
+        **{column: latest[column] for column in FRASER_METRIC_COLUMNS.values()},
+        'Median_Change_Days': latest['Median_Days'] - previous['Median_Days'],
+        'Mean_Median_Days': by_series['Median_Days'].mean(),
+    })
+    table[['First_Year', 'Latest_Year']] = table[['First_Year', 'Latest_Year']].astype(int)
+    return table.round(1).reset_index()
+
+
+def procedure_sheet(cihi_clean, quarter_pattern, crosswalk=None):
+    """Latest provincial quarter of every CIHI procedure, with reporting coverage"""
+    quarterly = cihi_clean[cihi_clean['Period'].str.match(quarter_pattern)]
+    totals = quarterly[quarterly['Zone'] == 'Total'].sort_values(['Year', 'Quarter'])
+    by_procedure = totals.groupby('Procedure')
+    latest = by_procedure.tail(1).set_index('Procedure')
+
+    table = pd.DataFrame({
+        'Quarters': by_procedure['Period'].nunique(),
+        'First_Period': by_procedure['Period'].first(),
+        'Latest_Period': latest['Period'],
+        **{column: latest[column] for column in CIHI_VALUE_COLUMNS},
+        'Mean_Surgery_Median': by_procedure['Surgery_Median'].mean().round(1),
+        'Facilities': quarterly.groupby('Procedure')['Facility'].nunique(),
+        'Providers': quarterly.groupby('Procedure')['Provider'].nunique(),
+    }).loc[latest.index.sort_values()]
+    if crosswalk is not None:
+        table['Fraser_Indicator'] = crosswalk.set_index('CIHI_Procedure')['Fraser_Indicator']
+    return table.reset_index()
+
+
+def _cell_rows(df):
+    """Rows of plain Python values (NaN as empty cells), converted ROW_CHUNK rows at a time"""
+    for start in range(0, len(df), ROW_CHUNK):
+        chunk = df.iloc[start:start + ROW_CHUNK].astype(object)
+        yield from chunk.where(chunk.notna(), None).itertuples(index=False, name=None)
+
+
+def _add_sheets(workbook, name, df):
+    """Stream one table into as many sheets as it needs; returns {sheet name: data rows}"""
+    per_sheet = MAX_SHEET_ROWS - 1
+    n_sheets = max(1, -(-len(df) // per_sheet))
+    header_format = workbook.add_format({'bold': True})
+    widths = []
+    for column in df.columns:
+        sample = df[column].iloc[:100].astype(str).str.len().max() if len(df) else 0
+        widths.append(min(max(len(str(column)), sample) + 2, MAX_COLUMN_WIDTH))
+    rows = _cell_rows(df)
+    written = {}
+    for part in range(n_sheets):
+        # Sheet names are capped at 31 characters
+        title = name if part == 0 else f"{name[:27]} ({part + 1})"
+        ws = workbook.add_worksheet(title)
+        for i, width in enumerate(widths):
+            ws.set_column(i, i, width)
+        ws.freeze_panes(1, 0)
+        # constant_memory only keeps the current row, so rows are written strictly in order
+        ws.write_row(0, 0, [str(column) for column in df.columns], header_format)
+        written[title] = min(per_sheet, len(df) - part * per_sheet)
+        for r in range(1, written[title] + 1):
+            ws.write_row(r, 0, next(rows))
+    return written
+
+
+def save_report(sheets, f):
+    """
+    Write [(sheet name, DataFrame)] as one xlsx to the binary file object f,
+    with a constant_memory workbook.
+
+    Empty or missing tables are skipped. Returns {sheet name: data rows}.
+    """
+    workbook = xlsxwriter.Workbook(f, WORKBOOK_OPTIONS)
+    written = {}
+    for name, df in sheets:
+        if df is None or df.empty:
+            continue
+        written.update(_add_sheets(workbook, name, df))
+    workbook.close()
+    return written
+
+
+def write_report(sheets, path=REPORT_FILE):
+    """save_report to path, replacing the file atomically; returns {sheet name: data rows}"""
+    written = {}
+    atomic_write_workbook(lambda f: written.update(save_report(sheets, f)), path)
+    return written
+
+
+if __name__ == "__main__":
+    import resource
+    import time
+
+    print("=== STREAMING EXCEL REPORT ===\n")
+    n_rows = 500_000
+    rng = np.random.default_rng(0)
+    raw = pd.DataFrame({
+        'Period': rng.choice(['2024_q3', '2024_q4', '2025_q1'], n_rows),
+        'Procedure': rng.choice([f"Procedure {i}" for i in range(150)], n_rows),
+        'Provider': rng.choice([f"Surgeon {i}" for i in range(3000)] + [None], n_rows),
+        'Surgery_Median': rng.gamma(2, 40, n_rows).round(),
+        'Surgery_90th': rng.gamma(2, 120, n_rows).round(),
+    })
+    # ru_maxrss is in KB on Linux
+    peak_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    written = write_report([('Raw Data', raw)], path='synthetic_report.xlsx')
+    peak_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{sum(written.values())} rows written to 'synthetic_report.xlsx' in {time.perf_counter() - start:.1f}s, "
+          f"peak memory grew by {(peak_after - peak_before) / 1024:.0f} MB "
+          f"(table itself: {raw.memory_usage(deep=True).sum() / 2**20:.0f} MB)")
@@ -0,0 +1,91 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import plotly.graph_objects as go
+
+# Reusable Plotly figure templates.
+#
+# A FigureTemplate is made once per process from a skeleton figure: the usual
+# go.Figure/make_subplots styling code, just without data. Its layout and
+# per-trace styles are validated at that point and kept as plain dicts, so
+# render() only has to drop the data arrays into copies of them.
+#
+# Data goes in as NumPy arrays, which Plotly (>= 6) serializes as base64
+# typed arrays ({"dtype": "f8", "bdata": ...}) instead of JSON number lists.
+# Rendered figures are memoized by a hash of their data, so asking again for
+# a figure whose data has not changed returns the same Figure object without
+# building or validating anything. Callers must treat it as read-only.
+
+FIGURE_CACHE_SIZE = 256
+
+
+def typed_array(values):
+    """Contiguous NumPy array for a trace data field (numeric data stays binary-encodable)"""
+    array = np.asarray(values)
+    if array.dtype == object:
+        return array
+    return np.ascontiguousarray(array)
+
+
+def _hash_value(digest, value):
+    if isinstance(value, np.ndarray):
+        digest.update(f"{value.dtype.str}{value.shape}".encode())
+        digest.update(value.tobytes() if value.dtype != object else repr(value.tolist()).encode())
+    else:
+        digest.update(repr(value).encode())
+
+
+class FigureTemplate:
+    def __init__(self, skeleton, keys):
+        """skeleton: a figure with one (data-less) trace per key, in drawing order"""
+        if len(keys) != len(skeleton.data):
+            raise ValueError(f"Template has {len(skeleton.data)} traces but {len(keys)} keys")
+        self.layout = skeleton.layout.to_plotly_json()
+        self.traces = OrderedDict(zip(keys, (trace.to_plotly_json() for trace in skeleton.data)))
+        self.builds = 0
+        self.hits = 0
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def data_hash(self, data, layout=None):
+        digest = hashlib.sha1()
+        for key in self.traces:
+            if key in data:
+                digest.update(key.encode())
+                for field, value in sorted(data[key].items()):
+                    digest.update(field.encode())
+                    _hash_value(digest, value)
+        _hash_value(digest, sorted((layout or {}).items()))
+        return digest.hexdigest()
+
+    def render(self, data, layout=None):
+        """
+        Figure with the given {trace key: {field: values}} data; trace keys
+        that are left out are not drawn. layout holds per-figure layout updates.
+        """
+        key = self.data_hash(data, layout)
+        with self._lock:
+            fig = self._figures.get(key)
+            if fig is not None:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                return fig
+
+        traces = []
+        for name, style in self.traces.items():
+            if name in data:
+                fields = {field: typed_array(value) if field in ('x', 'y') else value
+                          for field, value in data[name].items()}
+                traces.append(dict(style, **fields))
+        fig = go.Figure(data=traces, layout=self.layout)
+        if layout:
+            fig.update_layout(layout)
+
+        with self._lock:
+            self._figures[key] = fig
+            self.builds += 1
+            while len(self._figures) > FIGURE_CACHE_SIZE:
+                self._figures.popitem(last=False)
+        return fig
@@ -1,210 +1,413 @@
+import io
+import sys
+
 import pandas as pd
-import numpy as np
 
-print("=== FINAL MERGE: CIHI AND FRASER INSTITUTE WAIT TIMES ===\n")
+from anomaly_detection import (ANOMALIES_FILE, CHANGEPOINTS_FILE, detect_anomalies, detect_changepoints,
+                               facility_series, quarter_label)
+from bootstrap_stats import bootstrap_series
+from cihi_reader import describe_problems, read_cihi
+from excel_report import REPORT_FILE, procedure_sheet, province_sheet, save_report, summary_sheet
+from forecasting import FACILITY_FORECASTS_FILE, FORECASTS_FILE, NS_AVERAGE_INDICATOR, forecast_series, state_file
+from pipeline_dag import Stage, run_dag, source_hash
+from procedure_crosswalk import CROSSWALK_FILE, OVERRIDES_FILE, build_crosswalk, load_overrides
+from publish import MANIFEST_FILE, publish_outputs
+from rankings import RANKING_STATE_FILE, RANKINGS_FILE, rank_entities
+from snapshot_store import SnapshotStore
 
-# 1. Load and clean CIHI data
-print("1. LOADING CIHI DATA")
-print("-" * 50)
-cihi_df = pd.read_csv('Surgical_Wait_Times.csv')
+CIHI_FILE = 'Surgical_Wait_Times.csv'
+FRASER_FILE = 'wait-times-priority-procedures-in-canada-2025-data-tables-en.xlsx'
+MERGED_FILE = 'merged_wait_times_nova_scotia.csv'
+MERGED_PROCEDURE_FILE = 'merged_wait_times_by_procedure.csv'
+COMPARISON_FILE = 'wait_time_comparison.csv'
+BOOTSTRAP_FILE = 'wait_times_bootstrap_ci.csv'
+
+# Create province mapping for CIHI zones to standard province names
+# Based on the zones we saw: Zone 1, Zone 2, Zone 3, Zone 4, IWK, Total
+# These appear to be Nova Scotia health zones
+ZONE_TO_PROVINCE = {
+    'Zone 1': 'Nova Scotia',
+    'Zone 2': 'Nova Scotia',
+    'Zone 3': 'Nova Scotia',
+    'Zone 4': 'Nova Scotia',
+    'IWK': 'Nova Scotia',
+    'Total': 'Nova Scotia'
+}
+
+# CIHI columns the stages read; only these are converted by read_cihi
+CIHI_PIPELINE_COLUMNS = [
+    'Period', 'Year', 'Quarter',            # quarter series, crosswalk years, report periods
+    'Specialty', 'Procedure',               # crosswalk and ranking peer groups
+    'Zone', 'Facility', 'Provider',         # province mapping, facility series, rankings
+    'Surgery_Median', 'Surgery_90th',       # every analysis
+    'Consult_Median', 'Consult_90th',       # By Procedure and Raw Data report sheets
+]
+
+FRASER_YEAR_COL = 'Data year'
+FRASER_RESULT_COL = 'Indicator result'
+
+# Stage outputs published after every run, in write_outputs argument order
+OUTPUTS = [
+    ('merge', MERGED_FILE),
+    ('merge_procedures', MERGED_PROCEDURE_FILE),
+    ('crosswalk', CROSSWALK_FILE),
+    ('compare', COMPARISON_FILE),
+    ('bootstrap_ci', BOOTSTRAP_FILE),
+    ('anomalies', ANOMALIES_FILE),
+    ('changepoints', CHANGEPOINTS_FILE),
+    ('forecast_fraser', FORECASTS_FILE),
+    ('forecast_facilities', FACILITY_FORECASTS_FILE),
+    ('rankings', RANKINGS_FILE),
+]
 
-# Clean CIHI data - focus on meaningful rows
-cihi_clean = cihi_df.dropna(subset=['Specialty', 'Procedure'])
-print(f"CIHI original shape: {cihi_df.shape}")
-print(f"CIHI cleaned shape: {cihi_clean.shape}")
+# CIHI quarterly periods look like '2024_q3'; the rolling windows overlap them
+CIHI_QUARTER_PATTERN = r'^\d{4}_q\d$'
 
-# Show sample of cleaned CIHI data
-print("\nSample CIHI data:")
-print(cihi_clean[['Period', 'Specialty', 'Procedure', 'Zone', 'Year', 'Surgery_Median']].head())
 
-print("\n" + "="*100 + "\n")
+# 1. Load and clean CIHI data
+def load_cihi(path):
+    # Explicit schema, quoting, BOM and thousands separators are handled by the reader;
+    # malformed lines are reported rather than dropped silently
+    cihi_df = read_cihi(path, columns=CIHI_PIPELINE_COLUMNS)
+    for line in describe_problems(cihi_df):
+        print(f"CIHI: {line}")
+
+    # Rows without a procedure (specialty summaries) carry no wait time we can attribute
+    cihi_clean = cihi_df.dropna(subset=['Procedure'])
+    print(f"CIHI original shape: {cihi_df.shape}, cleaned shape: {cihi_clean.shape} "
+          f"({len(cihi_df) - len(cihi_clean)} rows without a procedure)")
+    return cihi_clean
+
 
 # 2. Load and clean Fraser Institute data
-print("2. LOADING FRASER INSTITUTE DATA")
-print("-" * 50)
-
-# Read raw data to find the actual data rows
-fraser_raw = pd.read_excel('wait-times-priority-procedures-in-canada-2025-data-tables-en.xlsx', 
-                          sheet_name=1, header=None)
-
-# Find the row that contains the actual column headers
-header_row = None
-for i in range(len(fraser_raw)):
-    row = fraser_raw.iloc[i]
-    if any(str(cell).strip() == 'Province' for cell in row if pd.notna(cell)):
-        header_row = i
-        break
-
-if header_row is not None:
-    print(f"Found header at row {header_row}")
-    
-    # Read with proper header
-    fraser_df = pd.read_excel('wait-times-priority-procedures-in-canada-2025-data-tables-en.xlsx', 
-                             sheet_name=1, header=header_row)
-    
-    print(f"Fraser Institute data shape: {fraser_df.shape}")
-    print(f"Fraser Institute columns: {list(fraser_df.columns)}")
-    
+def load_fraser(path):
+    # Read the sheet once and promote the row that contains the column headers
+    fraser_raw = pd.read_excel(path, sheet_name=1, header=None)
+
+    header_row = None
+    for i in range(len(fraser_raw)):
+        row = fraser_raw.iloc[i]
+        if any(str(cell).strip() == 'Province' for cell in row if pd.notna(cell)):
+            header_row = i
+            break
+
+    if header_row is None:
+        print("Could not find proper header row")
+        return None
+
+    fraser_df = fraser_raw.iloc[header_row + 1:].reset_index(drop=True)
+    fraser_df.columns = fraser_raw.iloc[header_row]
+    fraser_df.columns.name = None
+
     # Clean the data - remove rows with missing province
-    fraser_clean = fraser_df.dropna(subset=['Province'])
-    print(f"Fraser Institute cleaned shape: {fraser_clean.shape}")
-    
-    print("\nSample Fraser Institute data:")
-    print(fraser_clean.head())
-    
-    # Show unique provinces
-    print(f"\nFraser Institute provinces: {fraser_clean['Province'].unique()}")
-    
-    # Handle year column properly
-    year_col = 'Data year'
-    print(f"\nYear column: {year_col}")
-    
-    # Convert year to numeric and handle mixed types
-    fraser_clean[year_col] = pd.to_numeric(fraser_clean[year_col], errors='coerce')
-    valid_years = fraser_clean[year_col].dropna().unique()
-    print(f"Fraser Institute years: {sorted(valid_years)}")
-    
-    # Show data structure
-    print(f"\nFraser Institute data types:")
-    print(fraser_clean.dtypes)
-    
-    print(f"\nFraser Institute sample values by column:")
-    for col in fraser_clean.columns:
-        unique_vals = fraser_clean[col].dropna().unique()[:3]
-        print(f"{col}: {unique_vals}")
-    
-else:
-    print("Could not find proper header row")
-    fraser_clean = None
-
-print("\n" + "="*100 + "\n")
-
-# 3. Data standardization and merging
-print("3. DATA STANDARDIZATION AND MERGING")
-print("-" * 50)
-
-if fraser_clean is not None:
-    # Standardize province names
-    print("Standardizing province names...")
-    
-    # Create province mapping for CIHI zones to standard province names
-    # Based on the zones we saw: Zone 1, Zone 2, Zone 3, Zone 4, IWK, Total
-    # These appear to be Nova Scotia health zones
-    zone_to_province = {
-        'Zone 1': 'Nova Scotia',
-        'Zone 2': 'Nova Scotia', 
-        'Zone 3': 'Nova Scotia',
-        'Zone 4': 'Nova Scotia',
-        'IWK': 'Nova Scotia',
-        'Total': 'Nova Scotia'
-    }
-    
-    # Add province column to CIHI data
-    cihi_clean['Province'] = cihi_clean['Zone'].map(zone_to_province)
-    
+    fraser_clean = fraser_df.dropna(subset=['Province']).copy()
+    fraser_clean[FRASER_YEAR_COL] = pd.to_numeric(fraser_clean[FRASER_YEAR_COL], errors='coerce')
+    fraser_clean[FRASER_RESULT_COL] = pd.to_numeric(fraser_clean[FRASER_RESULT_COL], errors='coerce')
+    print(f"Fraser Institute header at row {header_row}, cleaned shape: {fraser_clean.shape}")
+    return fraser_clean
+
+
+# 3. Data standardization
+def normalize_cihi(cihi_clean):
+    # Clean CIHI data - focus on meaningful rows
+    cihi_clean = cihi_clean.dropna(subset=['Specialty', 'Procedure']).copy()
+    cihi_clean['Province'] = cihi_clean['Zone'].map(ZONE_TO_PROVINCE)
+
     # Filter to only include Nova Scotia data for comparison
-    cihi_ns = cihi_clean[cihi_clean['Province'] == 'Nova Scotia'].copy()
-    
-    print(f"CIHI Nova Scotia data shape: {cihi_ns.shape}")
-    
-    # Create summary statistics for CIHI
-    print("\nCIHI Nova Scotia Summary by Year:")
-    cihi_summary = cihi_ns.groupby('Year')['Surgery_Median'].agg(['mean', 'median', 'count']).round(1)
-    print(cihi_summary)
-    
-    # Create summary statistics for Fraser Institute
-    print("\nFraser Institute Nova Scotia Summary:")
-    fraser_ns = fraser_clean[fraser_clean['Province'] == 'Nova Scotia'].copy()
-    if not fraser_ns.empty:
-        # Find the indicator result column (actual wait time values)
-        result_col = 'Indicator result'
-        
-        # Convert result to numeric
-        fraser_ns[result_col] = pd.to_numeric(fraser_ns[result_col], errors='coerce')
-        
-        # Filter out invalid data
-        fraser_ns_clean = fraser_ns.dropna(subset=[result_col, year_col])
-        
-        if not fraser_ns_clean.empty:
-            fraser_summary = fraser_ns_clean.groupby(year_col)[result_col].agg(['mean', 'median', 'count']).round(1)
-            print(fraser_summary)
-            
-            # Show sample of Fraser Institute Nova Scotia data
-            print(f"\nSample Fraser Institute Nova Scotia data:")
-            print(fraser_ns_clean[['Province', year_col, 'Indicator', 'Metric', result_col]].head(10))
-        else:
-            print("No valid wait time data found in Fraser Institute Nova Scotia data")
-    else:
-        print("No Nova Scotia data found in Fraser Institute dataset")
-    
-    # Merge the datasets
-    print("\n" + "="*100)
-    print("4. MERGING DATASETS")
-    print("-" * 50)
-    
-    # Prepare CIHI data for merging
+    return cihi_clean[cihi_clean['Province'] == 'Nova Scotia'].copy()
+
+
+def normalize_fraser(fraser_clean):
+    if fraser_clean is None:
+        return None
+    fraser_ns = fraser_clean[fraser_clean['Province'] == 'Nova Scotia']
+
+    # Filter out invalid data
+    return fraser_ns.dropna(subset=[FRASER_RESULT_COL, FRASER_YEAR_COL]).copy()
+
+
+def normalize_cihi_procedures(cihi_clean):
+    # Provincial totals per quarter are the closest match to Fraser's provincial figures
+    quarterly = cihi_clean['Period'].str.match(CIHI_QUARTER_PATTERN)
+    cihi_total = cihi_clean[quarterly & (cihi_clean['Zone'] == 'Total')].copy()
+    cihi_total['Province'] = cihi_total['Zone'].map(ZONE_TO_PROVINCE)
+    return cihi_total.dropna(subset=['Year', 'Surgery_Median'])
+
+
+def crosswalk_procedures(overrides_path, cihi_clean, fraser_clean):
+    if fraser_clean is None:
+        return None
+    return build_crosswalk(cihi_clean['Procedure'].dropna().unique(),
+                           fraser_clean['Indicator'].dropna().unique(),
+                           load_overrides(overrides_path))
+
+
+# 4. Aggregation to (Province, Year)
+def aggregate_cihi(cihi_ns):
     cihi_merge = cihi_ns.groupby(['Province', 'Year']).agg({
         'Surgery_Median': 'mean',
         'Surgery_90th': 'mean'
     }).reset_index()
     cihi_merge.columns = ['Province', 'Year', 'CIHI_Surgery_Median_Days', 'CIHI_Surgery_90th_Days']
-    
-    print("CIHI data prepared for merging:")
-    print(cihi_merge)
-    
-    # Prepare Fraser Institute data for merging
-    if not fraser_ns.empty and not fraser_ns_clean.empty:
-        fraser_merge = fraser_ns_clean.groupby(['Province', year_col]).agg({
-            result_col: 'mean'
-        }).reset_index()
-        fraser_merge.columns = ['Province', 'Year', 'Fraser_Wait_Time_Days']
-        
-        print("\nFraser Institute data prepared for merging:")
-        print(fraser_merge)
-        
-        # Merge the datasets
-        merged_data = pd.merge(cihi_merge, fraser_merge, on=['Province', 'Year'], how='outer')
-        
-        print(f"\nMerged data shape: {merged_data.shape}")
-        print("\nMerged data:")
+    return cihi_merge
+
+
+def aggregate_fraser(fraser_ns_clean):
+    if fraser_ns_clean is None or fraser_ns_clean.empty:
+        return None
+    fraser_merge = fraser_ns_clean.groupby(['Province', FRASER_YEAR_COL]).agg({
+        FRASER_RESULT_COL: 'mean'
+    }).reset_index()
+    fraser_merge.columns = ['Province', 'Year', 'Fraser_Wait_Time_Days']
+    return fraser_merge
+
+
+# 4b. Aggregation to (Province, Year, Procedure), using Fraser indicator labels as the procedure key
+def aggregate_cihi_procedures(cihi_total, crosswalk):
+    if crosswalk is None:
+        return None
+    mapping = crosswalk.dropna(subset=['Fraser_Indicator']).set_index('CIHI_Procedure')['Fraser_Indicator']
+    cihi_total = cihi_total.assign(Procedure=cihi_total['Procedure'].map(mapping)).dropna(subset=['Procedure'])
+    cihi_merge = cihi_total.groupby(['Province', 'Year', 'Procedure']).agg({
+        'Surgery_Median': 'mean',
+        'Surgery_90th': 'mean'
+    }).reset_index()
+    cihi_merge.columns = ['Province', 'Year', 'Procedure', 'CIHI_Surgery_Median_Days', 'CIHI_Surgery_90th_Days']
+    return cihi_merge
+
+
+def aggregate_fraser_procedures(fraser_clean):
+    if fraser_clean is None:
+        return None
+    provincial = fraser_clean[(fraser_clean['Reporting level'] == 'Provincial')
+                              & (fraser_clean['Province'] == 'Nova Scotia')
+                              & fraser_clean['Metric'].isin(['50th Percentile', '90th Percentile'])]
+    provincial = provincial.dropna(subset=[FRASER_RESULT_COL, FRASER_YEAR_COL])
+    fraser_merge = provincial.pivot_table(index=['Province', FRASER_YEAR_COL, 'Indicator'],
+                                          columns='Metric', values=FRASER_RESULT_COL,
+                                          aggfunc='mean').reset_index()
+    fraser_merge.columns.name = None
+    return fraser_merge.rename(columns={
+        FRASER_YEAR_COL: 'Year',
+        'Indicator': 'Procedure',
+        '50th Percentile': 'Fraser_Median_Days',
+        '90th Percentile': 'Fraser_90th_Days',
+    })
+
+
+# 5. Merging and comparison
+def merge_sources(cihi_merge, fraser_merge):
+    if fraser_merge is None:
+        print("No Fraser Institute data available for Nova Scotia")
+        return None
+    return pd.merge(cihi_merge, fraser_merge, on=['Province', 'Year'], how='outer')
+
+
+def merge_procedures(cihi_merge, fraser_merge):
+    if cihi_merge is None or fraser_merge is None:
+        return None
+    return pd.merge(cihi_merge, fraser_merge, on=['Province', 'Year', 'Procedure'], how='outer')
+
+
+def compare_sources(merged_procedures):
+    if merged_procedures is None:
+        return None
+
+    # Compare median wait times for the same procedure and year in both datasets
+    comparison = merged_procedures.dropna(subset=['CIHI_Surgery_Median_Days', 'Fraser_Median_Days']).copy()
+    if comparison.empty:
+        return comparison
+
+    comparison['Difference_Days'] = comparison['CIHI_Surgery_Median_Days'] - comparison['Fraser_Median_Days']
+    comparison['Percent_Difference'] = (comparison['Difference_Days'] / comparison['Fraser_Median_Days']) * 100
+    return comparison
+
+
+# 6. Uncertainty for every Province x Indicator x Metric series
+def bootstrap_fraser(fraser_clean):
+    if fraser_clean is None:
+        return None
+    return bootstrap_series(fraser_clean, ['Province', 'Region', 'Indicator', 'Metric'],
+                            FRASER_RESULT_COL, FRASER_YEAR_COL)
+
+
+# 7. Outlier quarters and changepoints per Facility x Procedure
+def cihi_facility_series(cihi_clean):
+    return facility_series(cihi_clean, CIHI_QUARTER_PATTERN)
+
+
+# 8. Projections for every Fraser series and every Facility x Procedure series.
+# Fitted parameters persist between runs, so a new year/quarter only rolls
+# the stored states forward (see forecasting.py)
+def forecast_fraser(fraser_clean, fraser_merge):
+    if fraser_clean is None:
+        return None
+    series = fraser_clean.dropna(subset=[FRASER_YEAR_COL, FRASER_RESULT_COL])
+    if fraser_merge is not None:
+        headline = fraser_merge.rename(columns={'Year': FRASER_YEAR_COL,
+                                                'Fraser_Wait_Time_Days': FRASER_RESULT_COL})
+        headline = headline.assign(Region=None, Indicator=NS_AVERAGE_INDICATOR, Metric='Mean')
+        series = pd.concat([series, headline], ignore_index=True)
+    forecasts = forecast_series(series, ['Province', 'Region', 'Indicator', 'Metric'],
+                                FRASER_RESULT_COL, FRASER_YEAR_COL, state_path=state_file('fraser'))
+    return forecasts.rename(columns={'Time': 'Year'}).astype({'Year': int})
+
+
+def forecast_facilities(series):
+    forecasts = forecast_series(series, ['Facility', 'Procedure', 'Metric'], 'Value', 'Quarter_Index',
+                                horizon=4, state_path=state_file('facilities'))
+    forecasts.insert(3, 'Period', [quarter_label(t) for t in forecasts.pop('Time')])
+    return forecasts
+
+
+# 9. Percentile ranks of providers and facilities within each procedure and period;
+# peer groups unchanged since the last run are carried over (see rankings.py)
+def rank_providers(cihi_clean):
+    return rank_entities(cihi_clean, state_path=RANKING_STATE_FILE)
+
+
+# 10. Stakeholder workbook: the summary sheets are small aggregates built here,
+# then every sheet is streamed into one xlsx (see excel_report.py). The stage
+# returns the workbook bytes, so it is cached like any other stage and the
+# file is published with the tables by write_outputs
+def build_workbook(cihi_clean, fraser_clean, comparison, crosswalk):
+    buffer = io.BytesIO()
+    sheets = save_report([
+        ('Summary', summary_sheet(cihi_clean, fraser_clean, FRASER_YEAR_COL, comparison)),
+        ('By Province', province_sheet(fraser_clean, FRASER_YEAR_COL, FRASER_RESULT_COL)),
+        ('By Procedure', procedure_sheet(cihi_clean, CIHI_QUARTER_PATTERN, crosswalk)),
+        ('Raw Data', cihi_clean),
+    ], buffer)
+    return {'data': buffer.getvalue(), 'sheets': sheets}
+
+
+def code_version():
+    """Hash of this pipeline's source, including every project module it imports"""
+    return source_hash(sys.modules[__name__])
+
+
+def write_outputs(cihi_file, fraser_file, overrides_file, *results, input_hashes):
+    # Temp-file-and-rename for every table and the report, then a new manifest
+    # version; every run is also kept as a content-addressed snapshot. Empty tables are
+    # published header-only; a stage that produced nothing (None) unpublishes its file.
+    # The manifest records the input hashes taken when the run started, so a file
+    # replaced mid-run shows up as changed on the next check instead of as published
+    *tables, report = results
+    published = {path: table for (_, path), table in zip(OUTPUTS, tables)}
+    published[REPORT_FILE] = report['data']
+    return publish_outputs(published, inputs=input_hashes,
+                           store=SnapshotStore(), code=code_version())
+
+
+def build_stages(cihi_file=CIHI_FILE, fraser_file=FRASER_FILE, overrides_file=OVERRIDES_FILE):
+    """The merge pipeline as a DAG; the CIHI and Fraser branches are independent until the merge"""
+    return [
+        Stage('load_cihi', load_cihi, inputs=[cihi_file]),
+        Stage('load_fraser', load_fraser, inputs=[fraser_file]),
+        Stage('normalize_cihi', normalize_cihi, deps=['load_cihi']),
+        Stage('normalize_fraser', normalize_fraser, deps=['load_fraser']),
+        Stage('aggregate_cihi', aggregate_cihi, deps=['normalize_cihi']),
+        Stage('aggregate_fraser', aggregate_fraser, deps=['normalize_fraser']),
+        Stage('merge', merge_sources, deps=['aggregate_cihi', 'aggregate_fraser']),
+        Stage('crosswalk', crosswalk_procedures, deps=['load_cihi', 'load_fraser'], inputs=[overrides_file]),
+        Stage('normalize_cihi_procedures', normalize_cihi_procedures, deps=['load_cihi']),
+        Stage('aggregate_cihi_procedures', aggregate_cihi_procedures,
+              deps=['normalize_cihi_procedures', 'crosswalk']),
+        Stage('aggregate_fraser_procedures', aggregate_fraser_procedures, deps=['load_fraser']),
+        Stage('merge_procedures', merge_procedures,
+              deps=['aggregate_cihi_procedures', 'aggregate_fraser_procedures']),
+        Stage('compare', compare_sources, deps=['merge_procedures']),
+        Stage('bootstrap_ci', bootstrap_fraser, deps=['load_fraser']),
+        Stage('facility_series', cihi_facility_series, deps=['load_cihi']),
+        Stage('anomalies', detect_anomalies, deps=['facility_series']),
+        Stage('changepoints', detect_changepoints, deps=['facility_series']),
+        Stage('forecast_fraser', forecast_fraser, deps=['load_fraser', 'aggregate_fraser'],
+              state=[state_file('fraser')]),
+        Stage('forecast_facilities', forecast_facilities, deps=['facility_series'],
+              state=[state_file('facilities')]),
+        Stage('rankings', rank_providers, deps=['load_cihi'], state=[RANKING_STATE_FILE]),
+        Stage('report', build_workbook, deps=['load_cihi', 'load_fraser', 'compare', 'crosswalk']),
+        Stage('write_outputs', write_outputs, deps=[stage for stage, _ in OUTPUTS] + ['report'],
+              inputs=[cihi_file, fraser_file, overrides_file], cache=False, input_hashes=True),
+    ]
+
+
+def main():
+    print("=== FINAL MERGE: CIHI AND FRASER INSTITUTE WAIT TIMES ===\n")
+
+    print("1. RUNNING PIPELINE STAGES")
+    print("-" * 50)
+    results = run_dag(build_stages())
+
+    print("\n" + "="*100)
+    print("2. MERGED DATA")
+    print("-" * 50)
+
+    merged_data = results['merge']
+    if merged_data is None:
+        print("Could not process Fraser Institute data")
+    else:
+        print(f"Merged data shape: {merged_data.shape}")
         print(merged_data)
-        
-        # Save merged data
-        merged_data.to_csv('merged_wait_times_nova_scotia.csv', index=False)
-        print("\nMerged data saved to 'merged_wait_times_nova_scotia.csv'")
-        
-        # Create comparison analysis
+        print(f"\nMerged data saved to '{MERGED_FILE}'")
+
+        crosswalk = results['crosswalk']
+        matched = crosswalk['Fraser_Indicator'].notna()
+        print(f"\nProcedure crosswalk: {matched.sum()} of {len(crosswalk)} CIHI procedures matched "
+              f"({crosswalk.attrs.get('comparisons', 0)} candidate pairs scored), saved to '{CROSSWALK_FILE}'")
+        print(crosswalk[matched])
+        print(f"\nProcedure-level merge saved to '{MERGED_PROCEDURE_FILE}'")
+
         print("\n" + "="*100)
-        print("5. COMPARISON ANALYSIS")
+        print("3. COMPARISON ANALYSIS")
         print("-" * 50)
-        
-        # Compare wait times where both datasets have data
-        comparison = merged_data.dropna()
-        if not comparison.empty:
-            print("Wait Time Comparison (where both datasets have data):")
+
+        comparison = results['compare']
+        if comparison is not None and not comparison.empty:
+            print("Wait Time Comparison (same procedure and year in both datasets):")
             print(comparison)
-            
+
             # Calculate correlation
-            correlation = comparison['CIHI_Surgery_Median_Days'].corr(comparison['Fraser_Wait_Time_Days'])
+            correlation = comparison['CIHI_Surgery_Median_Days'].corr(comparison['Fraser_Median_Days'])
             print(f"\nCorrelation between CIHI and Fraser Institute wait times: {correlation:.3f}")
-            
-            # Calculate differences
-            comparison['Difference_Days'] = comparison['CIHI_Surgery_Median_Days'] - comparison['Fraser_Wait_Time_Days']
-            comparison['Percent_Difference'] = (comparison['Difference_Days'] / comparison['Fraser_Wait_Time_Days']) * 100
-            
+
             print(f"\nAverage difference: {comparison['Difference_Days'].mean():.1f} days")
             print(f"Average percent difference: {comparison['Percent_Difference'].mean():.1f}%")
-            
-            # Save comparison data
-            comparison.to_csv('wait_time_comparison.csv', index=False)
-            print("\nComparison data saved to 'wait_time_comparison.csv'")
+            print(f"\nComparison data saved to '{COMPARISON_FILE}'")
         else:
             print("No overlapping data found for comparison")
-    else:
-        print("No Fraser Institute data available for Nova Scotia")
-else:
-    print("Could not process Fraser Institute data")
 
-print("\n" + "="*100)
-print("MERGE COMPLETE")
-print("="*100) 
\ No newline at end of file
+        bootstrap_ci = results['bootstrap_ci']
+        if bootstrap_ci is not None:
+            n_series = bootstrap_ci['Statistic'].eq('Mean').sum()
+            print(f"\nBootstrap confidence intervals for {n_series} series saved to '{BOOTSTRAP_FILE}'")
+
+        print(f"\n{len(results['anomalies'])} outlier quarters saved to '{ANOMALIES_FILE}'")
+        print(f"{len(results['changepoints'])} changepoints saved to '{CHANGEPOINTS_FILE}'")
+
+        for stage, path in [('forecast_fraser', FORECASTS_FILE), ('forecast_facilities', FACILITY_FORECASTS_FILE)]:
+            forecasts = results[stage]
+            if forecasts is not None:
+                summary = ', '.join(f"{count} {kind}" for kind, count in forecasts.attrs.get('updates', {}).items())
+                print(f"Forecasts ({summary}) saved to '{path}'")
+
+        rankings = results['rankings']
+        print(f"{len(rankings)} provider/facility ranks saved to '{RANKINGS_FILE}'"
+              + (f" ({rankings.attrs['reranked_groups']} of {rankings.attrs['total_groups']} peer groups re-ranked)"
+                 if 'total_groups' in rankings.attrs else ""))
+
+    sheets = results['report']['sheets']
+    print(f"\nReport with {len(sheets)} sheets ({', '.join(f'{name}: {rows} rows' for name, rows in sheets.items())}) "
+          f"saved to '{REPORT_FILE}'")
+
+    manifest = results['write_outputs']
+    print(f"\nPublished output version {manifest['version']} ('{MANIFEST_FILE}'), "
+          f"snapshot {manifest['snapshot']}")
+
+    print("\n" + "="*100)
+    print("MERGE COMPLETE")
+    print("="*100)
+
+
+if __name__ == "__main__":
+    main()
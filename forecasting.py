@@ -0,0 +1,247 @@
+import os
+import pickle
+
+import numpy as np
+
+from bootstrap_stats import build_series_matrix
+from publish import atomic_write_bytes
+
+# Batched exponential smoothing forecasts for every wait time series.
+#
+# Both models are additive-error ETS with an optionally damped trend:
+#   forecast  y(t)  = level + phi * trend
+#   level          = level + phi * trend + alpha * error
+#   trend          = phi * trend + alpha * beta * error
+# Simple exponential smoothing is the phi = 0 special case. Every series is
+# fitted against a whole grid of (alpha, beta, phi) at once: the recursion
+# loops over time steps only, with the (series x grid) state as one array.
+# The best grid point per series is picked by AIC.
+#
+# Fitted parameters and final states are kept in FORECAST_STATE_DIR. When a
+# series only gained new points since the last run (its history is otherwise
+# unchanged), the stored state is rolled forward over the new points with
+# the stored parameters instead of refitting; a full refit happens every
+# REFIT_EVERY new points or when the history was revised.
+
+FORECASTS_FILE = 'wait_time_forecasts.csv'
+FACILITY_FORECASTS_FILE = 'facility_wait_time_forecasts.csv'
+FORECAST_STATE_DIR = '.forecast_state'
+
+# Label of the dashboard's headline series (mean of all Nova Scotia Fraser results per year)
+NS_AVERAGE_INDICATOR = 'All Indicators (Average)'
+
+HORIZON = 3
+CONFIDENCE_Z = 1.96  # 95% prediction intervals
+REFIT_EVERY = 4
+
+ALPHAS = np.round(np.linspace(0.05, 0.95, 10), 2)
+BETAS = np.array([0.05, 0.1, 0.2, 0.4])
+PHIS = np.array([0.8, 0.9, 0.98])
+
+
+def _parameter_grid():
+    """(alpha, beta, phi, n_params) rows; SES first (phi = 0), then damped trend"""
+    ses = [(a, 0.0, 0.0, 2) for a in ALPHAS]
+    damped = [(a, b, p, 5) for a in ALPHAS for b in BETAS for p in PHIS]
+    return np.array(ses + damped, dtype=float)
+
+
+def _initial_state(values, lengths):
+    level = values[:, 0].copy()
+    if values.shape[1] < 2:
+        return level, np.zeros(len(level))
+    trend = np.where(lengths > 1, values[:, 1] - values[:, 0], 0.0)
+    return level, np.nan_to_num(trend)
+
+
+def _smooth(values, valid, level, trend, alpha, beta, phi, start=0):
+    """
+    Run the ETS recursion over columns start.. of values for a batch of states.
+
+    values/valid are (s, T); level/trend/alpha/beta/phi broadcast against
+    (s, g). Returns the final (level, trend, sse, n_errors).
+    """
+    sse = np.zeros(np.broadcast(level, alpha).shape)
+    n_errors = np.zeros(sse.shape)
+    level = level + sse
+    trend = trend + sse
+    for t in range(start, values.shape[1]):
+        y = values[:, t][:, None]
+        ok = valid[:, t][:, None]
+        error = np.where(ok, y - (level + phi * trend), 0.0)
+        level = np.where(ok, level + phi * trend + alpha * error, level)
+        trend = np.where(ok, phi * trend + alpha * beta * error, trend)
+        sse += error ** 2
+        n_errors += ok
+    return level, trend, sse, n_errors
+
+
+def fit_batch(values, lengths):
+    """Grid-search fit for every row of a padded matrix; returns a dict of per-series arrays"""
+    grid = _parameter_grid()
+    alpha, beta, phi, k = (grid[:, i][None, :] for i in range(4))
+    valid = np.arange(values.shape[1])[None, :] < lengths[:, None]
+
+    level0, trend0 = _initial_state(values, lengths)
+    # SES rows ignore the trend; damped rows start from the first difference
+    trend0 = np.where(phi > 0, trend0[:, None], 0.0)
+    level, trend, sse, n_errors = _smooth(values, valid, level0[:, None], trend0, alpha, beta, phi, start=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        aic = n_errors * np.log(np.maximum(sse, 1e-9) / np.maximum(n_errors, 1)) + 2 * k
+    # Too few points to support a trend: fall back to SES
+    aic = np.where((k > 2) & (n_errors < 4), np.inf, aic)
+    best = np.argmin(aic, axis=1)
+    rows = np.arange(len(best))
+
+    return {
+        'alpha': grid[best, 0], 'beta': grid[best, 1], 'phi': grid[best, 2],
+        'n_params': grid[best, 3],
+        'level': level[rows, best], 'trend': trend[rows, best],
+        'sse': sse[rows, best], 'n_errors': n_errors[rows, best],
+        'updates_since_fit': np.zeros(len(best), dtype=int),
+    }
+
+
+def _model_name(phi):
+    return np.where(phi > 0, 'Damped Trend', 'SES')
+
+
+def forecast_from_state(state, horizon=HORIZON, z=CONFIDENCE_Z):
+    """Point forecasts and prediction intervals, shape (n_series, horizon)"""
+    alpha, beta, phi = state['alpha'][:, None], state['beta'][:, None], state['phi'][:, None]
+    steps = np.arange(1, horizon + 1)[None, :]
+
+    # phi + phi^2 + ... + phi^h
+    damp_sum = np.cumsum(phi ** steps, axis=1)
+    point = state['level'][:, None] + damp_sum * state['trend'][:, None]
+
+    # Var(h) = sigma^2 * (1 + sum_{j<h} c_j^2), c_j = alpha * (1 + beta * (phi + ... + phi^j))
+    c = alpha * (1 + beta * damp_sum)
+    variance_terms = np.concatenate([np.zeros((len(alpha), 1)), np.cumsum(c ** 2, axis=1)[:, :-1]], axis=1)
+    dof = np.maximum(state['n_errors'] - state['n_params'], 1)
+    # No interval without at least two one-step errors to estimate the noise from
+    sigma2 = np.where(state['n_errors'] >= 2, state['sse'] / dof, np.nan)[:, None]
+    half_width = z * np.sqrt(sigma2 * (1 + variance_terms))
+    return point, point - half_width, point + half_width
+
+
+def _load_state(path):
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _save_state(state, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    atomic_write_bytes(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), path)
+
+
+def state_file(name):
+    return os.path.join(FORECAST_STATE_DIR, f"{name}.pkl")
+
+
+def forecast_series(df, keys, value_col, time_col, horizon=HORIZON, time_step=1, state_path=None):
+    """
+    Forecast every series in df (one per unique combination of keys).
+
+    time_col must count in steps of time_step (years, quarter indexes).
+    Without state_path every series is refitted from scratch.
+
+    Returns a long DataFrame with the key columns plus Time, Forecast,
+    PI_Low, PI_High, Model, Alpha, Beta and Phi. How each series was
+    updated depends on the stored state, not on the data, so it is not a
+    column: attrs['updates'] counts series per 'fit', 'incremental' and
+    'cached'.
+    """
+    series_keys, values, times, lengths = build_series_matrix(df, keys, value_col, time_col)
+    n_series, max_len = values.shape
+    last_time = times[np.arange(n_series), np.maximum(lengths - 1, 0)]
+
+    params = ('alpha', 'beta', 'phi', 'n_params', 'level', 'trend', 'sse', 'n_errors', 'updates_since_fit')
+    state = {name: np.zeros(n_series) for name in params}
+    state['updates_since_fit'] = np.zeros(n_series, dtype=int)
+    update = np.full(n_series, 'fit', dtype=object)
+    refit = np.ones(n_series, dtype=bool)
+
+    previous = _load_state(state_path)
+    if previous is not None and list(previous['keys'].columns) == list(keys):
+        # Line up stored series with the current ones by key
+        current = series_keys.copy()
+        current['_row'] = np.arange(n_series)
+        stored = previous['keys'].copy()
+        stored['_prev'] = np.arange(len(stored))
+        matched = current.merge(stored, on=keys, how='inner')
+        cur_rows = matched['_row'].to_numpy()
+        prev_rows = matched['_prev'].to_numpy()
+
+        prev_len = previous['lengths'][prev_rows]
+        prev_hist = previous['values'][prev_rows]
+        width = min(prev_hist.shape[1], max_len)
+        cols = np.arange(width)[None, :]
+        in_prefix = cols < prev_len[:, None]
+        same_prefix = np.all(~in_prefix | (values[cur_rows, :width] == prev_hist[:, :width]), axis=1)
+        new_points = lengths[cur_rows] - prev_len
+        reusable = (same_prefix & (prev_len <= width) & (new_points >= 0)
+                    & (previous['updates_since_fit'][prev_rows] + new_points < REFIT_EVERY))
+
+        cur_rows, prev_rows, new_points = cur_rows[reusable], prev_rows[reusable], new_points[reusable]
+        for name in params:
+            state[name][cur_rows] = previous[name][prev_rows]
+        refit[cur_rows] = False
+        update[cur_rows] = np.where(new_points > 0, 'incremental', 'cached')
+
+        # Roll stored states forward over just the new points, with stored parameters
+        grow = cur_rows[new_points > 0]
+        if len(grow):
+            start = int(previous['lengths'][prev_rows[new_points > 0]].min())
+            valid = ((np.arange(max_len)[None, :] < lengths[grow, None])
+                     & (np.arange(max_len)[None, :] >= (lengths[grow] - new_points[new_points > 0])[:, None]))
+            level, trend, sse, n_errors = _smooth(
+                values[grow], valid, state['level'][grow, None], state['trend'][grow, None],
+                state['alpha'][grow, None], state['beta'][grow, None], state['phi'][grow, None], start=start)
+            state['level'][grow] = level[:, 0]
+            state['trend'][grow] = trend[:, 0]
+            state['sse'][grow] += sse[:, 0]
+            state['n_errors'][grow] += n_errors[:, 0]
+            state['updates_since_fit'][grow] += new_points[new_points > 0]
+
+    if refit.any():
+        fitted = fit_batch(values[refit], lengths[refit])
+        for name in params:
+            state[name][refit] = fitted[name]
+
+    # Left untouched when nothing changed, so the file (and caches keyed on it) stay stable
+    all_cached = previous is not None and len(previous['keys']) == n_series and (update == 'cached').all()
+    if state_path is not None and not all_cached:
+        _save_state(dict(state, keys=series_keys, values=values, lengths=lengths), state_path)
+
+    point, low, high = forecast_from_state(state, horizon)
+    frame = series_keys.loc[series_keys.index.repeat(horizon)].reset_index(drop=True)
+    frame['Time'] = (last_time[:, None] + time_step * np.arange(1, horizon + 1)[None, :]).ravel()
+    frame['Forecast'] = point.ravel()
+    frame['PI_Low'] = low.ravel()
+    frame['PI_High'] = high.ravel()
+    frame['Model'] = np.repeat(_model_name(state['phi']), horizon)
+    for name in ('alpha', 'beta', 'phi'):
+        frame[name.capitalize()] = np.repeat(state[name], horizon)
+    kinds, counts = np.unique(update.astype(str), return_counts=True)
+    frame.attrs['updates'] = dict(zip(kinds.tolist(), counts.tolist()))
+    return frame
+
+
+if __name__ == "__main__":
+    import time
+
+    from final_merge_script import FRASER_FILE, FRASER_RESULT_COL, FRASER_YEAR_COL, load_fraser
+
+    print("=== BATCHED WAIT TIME FORECASTS ===\n")
+    fraser = load_fraser(FRASER_FILE)
+    start = time.perf_counter()
+    forecasts = forecast_series(fraser, ['Province', 'Region', 'Indicator', 'Metric'],
+                                FRASER_RESULT_COL, FRASER_YEAR_COL, state_path=state_file('fraser'))
+    n_series = len(forecasts) // HORIZON
+    print(f"{n_series} series forecast in {time.perf_counter() - start:.3f}s")
+    print(forecasts.attrs['updates'])
+    print(forecasts[(forecasts['Province'] == 'Nova Scotia') & forecasts['Region'].isna()].head(12))
@@ -0,0 +1,236 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import random
+import resource
+import sys
+import threading
+import time
+
+import numpy as np
+
+# Offline load test for web_dashboard.py.
+#
+# N simulated sessions each drive their own AppTest through a scripted
+# sequence of interactions (year range changes, projection selector changes,
+# reloads) with a random think time in between. Sessions are spread over W
+# worker processes, standing in for W Streamlit server processes: within a
+# worker, sessions are threads that share one st.cache_data store, and reruns
+# go through one lock. AppTest keeps a process-global runtime, so two reruns
+# cannot overlap in one process, and on a real server CPU-bound reruns are
+# serialized by the GIL anyway. Latency is measured from the moment a
+# session asks for a rerun, so it includes the time spent queued behind
+# other sessions, as a user would see it.
+#
+# The report has p50/p95/p99 latency per interaction, throughput, CPU time
+# and resident memory per session. Nothing leaves the machine: the app reads
+# the local snapshots, which are built with the merge pipeline first if they
+# are missing.
+
+APP_FILE = 'web_dashboard.py'
+DEFAULT_SESSIONS = 20
+DEFAULT_WORKERS = 1
+DEFAULT_INTERACTIONS = 10
+DEFAULT_THINK_TIME = 0.5
+RERUN_TIMEOUT = 120
+
+INTERACTIONS = ['year_range', 'projection', 'reload']
+
+
+def ensure_local_data():
+    from snapshot_store import SnapshotStore
+    if SnapshotStore().latest_id() is None and not os.path.exists('merged_wait_times_nova_scotia.csv'):
+        from final_merge_script import build_stages
+        from pipeline_dag import run_dag
+        print("No published outputs yet, running the merge pipeline first\n")
+        run_dag(build_stages(), verbose=False)
+
+
+def rss_bytes():
+    """Current resident set size (Linux); falls back to the peak RSS elsewhere"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _interact(at, kind, rng):
+    """Apply one scripted interaction; returns False if the app has no such widget"""
+    if kind == 'year_range':
+        slider = at.slider[0]
+        low, high = slider.min, slider.max
+        start = rng.randint(low, high - 1)
+        slider.set_value((start, rng.randint(start + 1, high)))
+    elif kind == 'projection':
+        selectors = [box for box in at.selectbox if box.label == 'Indicator']
+        if not selectors:
+            return False
+        selectors[0].select(rng.choice(selectors[0].options))
+    return True
+
+
+def _run_session(at, n_interactions, rng, think_time, run_lock, timings):
+    def rerun(kind):
+        start = time.perf_counter()
+        with run_lock:
+            at.run()
+        timings.append((kind, time.perf_counter() - start, bool(at.exception)))
+
+    rerun('initial')
+    for _ in range(n_interactions):
+        time.sleep(rng.uniform(0, 2 * think_time))
+        kind = rng.choice(INTERACTIONS)
+        with run_lock:
+            applied = _interact(at, kind, rng)
+        if applied:
+            rerun(kind)
+
+
+def run_worker(session_ids, n_interactions, seed, think_time, barrier, queue):
+    """One simulated server process: its sessions as threads, reruns serialized"""
+    from streamlit.logger import set_log_level
+    from streamlit.testing.v1 import AppTest
+
+    # Warm imports and caches, as a long-running server would have
+    AppTest.from_file(APP_FILE, default_timeout=RERUN_TIMEOUT).run()
+    # Per-rerun warnings from every session would drown the report (AppTest resets the level on first use)
+    set_log_level('error')
+
+    run_lock = threading.Lock()
+    sessions = {session_id: (AppTest.from_file(APP_FILE, default_timeout=RERUN_TIMEOUT), [])
+                for session_id in session_ids}
+    failures = []
+
+    def session_thread(session_id):
+        at, timings = sessions[session_id]
+        try:
+            _run_session(at, n_interactions, random.Random(seed + session_id), think_time, run_lock, timings)
+        except Exception as e:
+            # A harness-level failure (e.g. a rerun timeout) counts as an error
+            failures.append(f"Session {session_id}: {e!r}")
+
+    threads = [threading.Thread(target=session_thread, args=(i,), daemon=True) for i in session_ids]
+    rss_before = rss_bytes()
+    barrier.wait()
+    cpu_start = cpu_seconds()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Sessions are still referenced here, so their memory is included
+    queue.put({
+        'sessions': len(session_ids),
+        'timings': [t for _, timings in sessions.values() for t in timings],
+        'failures': failures,
+        'cpu_s': cpu_seconds() - cpu_start,
+        'rss_before': rss_before,
+        'rss_after': rss_bytes(),
+    })
+
+
+def percentiles(latencies_s):
+    if not latencies_s:
+        return {'p50': float('nan'), 'p95': float('nan'), 'p99': float('nan')}
+    ms = np.asarray(latencies_s) * 1000
+    return {f"p{q}": float(np.percentile(ms, q)) for q in (50, 95, 99)}
+
+
+def load_test(n_sessions=DEFAULT_SESSIONS, n_workers=DEFAULT_WORKERS, n_interactions=DEFAULT_INTERACTIONS,
+              think_time=DEFAULT_THINK_TIME, seed=0):
+    ensure_local_data()
+    n_workers = max(1, min(n_workers, n_sessions))
+
+    ctx = mp.get_context('spawn')
+    barrier = ctx.Barrier(n_workers + 1)
+    queue = ctx.Queue()
+    workers = [ctx.Process(target=run_worker,
+                           args=(list(range(w, n_sessions, n_workers)), n_interactions, seed, think_time,
+                                 barrier, queue))
+               for w in range(n_workers)]
+    for worker in workers:
+        worker.start()
+
+    barrier.wait()
+    wall_start = time.perf_counter()
+    reports = [queue.get() for _ in workers]
+    wall = time.perf_counter() - wall_start
+    for worker in workers:
+        worker.join()
+
+    timings = [t for report in reports for t in report['timings']]
+    failures = [f for report in reports for f in report['failures']]
+    by_kind = {}
+    for kind, latency, _ in timings:
+        by_kind.setdefault(kind, []).append(latency)
+    cpu = sum(report['cpu_s'] for report in reports)
+    session_memory = [(report['rss_after'] - report['rss_before']) / report['sessions'] for report in reports]
+
+    return {
+        'sessions': n_sessions,
+        'workers': n_workers,
+        'interactions_per_session': n_interactions,
+        'think_time_s': think_time,
+        'reruns': len(timings),
+        'errors': sum(failed for _, _, failed in timings) + len(failures),
+        'failures': failures,
+        'wall_s': wall,
+        'throughput_rps': len(timings) / wall if wall > 0 else 0.0,
+        'cpu_s': cpu,
+        'cpu_utilization': cpu / wall if wall > 0 else 0.0,
+        'rss_per_worker_mb': [report['rss_after'] / 2**20 for report in reports],
+        'memory_per_session_mb': max(np.mean(session_memory), 0) / 2**20,
+        'latency_ms': percentiles([latency for _, latency, _ in timings]),
+        'latency_by_interaction_ms': {kind: dict(percentiles(values), n=len(values))
+                                      for kind, values in sorted(by_kind.items())},
+    }
+
+
+def print_report(report):
+    print(f"=== DASHBOARD LOAD TEST: {report['sessions']} CONCURRENT SESSIONS, "
+          f"{report['workers']} WORKER(S) ===\n")
+    print(f"Reruns: {report['reruns']} in {report['wall_s']:.1f}s "
+          f"({report['throughput_rps']:.1f}/s), errors: {report['errors']}")
+    for failure in report['failures']:
+        print(f"  {failure}")
+    print(f"CPU: {report['cpu_s']:.1f}s ({report['cpu_utilization']:.0%} of one core)")
+    rss = ', '.join(f"{mb:.0f}" for mb in report['rss_per_worker_mb'])
+    print(f"Memory: {rss} MB resident per worker, ~{report['memory_per_session_mb']:.1f} MB per session\n")
+
+    print(f"{'Interaction':<12}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = list(report['latency_by_interaction_ms'].items())
+    rows.append(('all', dict(report['latency_ms'], n=report['reruns'])))
+    for kind, stats in rows:
+        print(f"{kind:<12}{stats['n']:>6}{stats['p50']:>10.0f}{stats['p95']:>10.0f}{stats['p99']:>10.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for the Streamlit dashboard")
+    parser.add_argument('--sessions', type=int, default=DEFAULT_SESSIONS)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help="Simulated server processes the sessions are spread over")
+    parser.add_argument('--interactions', type=int, default=DEFAULT_INTERACTIONS,
+                        help="Scripted interactions per session after the initial load")
+    parser.add_argument('--think-time', type=float, default=DEFAULT_THINK_TIME,
+                        help="Mean pause between a session's interactions, in seconds")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Also write the report to this JSON file")
+    parser.add_argument('--max-p95-ms', type=float,
+                        help="Exit with status 1 if the overall p95 latency exceeds this")
+    args = parser.parse_args()
+
+    report = load_test(args.sessions, args.workers, args.interactions, args.think_time, args.seed)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if report['errors'] or (args.max_p95_ms is not None and report['latency_ms']['p95'] > args.max_p95_ms):
+        sys.exit(1)
@@ -1,12 +1,14 @@
 import pandas as pd
 import numpy as np
 
+from cihi_reader import read_cihi
+
 print("=== MERGING CIHI AND FRASER INSTITUTE WAIT TIMES ===\n")
 
 # 1. Load and clean CIHI data
 print("1. LOADING CIHI DATA")
 print("-" * 40)
-cihi_df = pd.read_csv('Surgical_Wait_Times.csv')
+cihi_df = read_cihi('Surgical_Wait_Times.csv')
 
 # Clean CIHI data - focus on meaningful rows
 cihi_clean = cihi_df.dropna(subset=['Specialty', 'Procedure'])
@@ -0,0 +1,305 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import pandas as pd
+
+# Small DAG executor for the wait times pipeline.
+#
+# Each stage declares the file paths it reads and the stages it depends on.
+# A stage's cache key is the hash of its own source code, its input files and
+# the *output* hashes of its dependencies, so a re-run only recomputes what is
+# downstream of an actual change (and stops early when an upstream stage
+# re-runs but produces identical output). Independent stages run concurrently.
+#
+# The code part of the key covers the source of the module that defines the
+# stage function and of every project module it imports, directly or not, so
+# editing a constant or a helper invalidates the stages that could use it.
+# Stages that keep state between runs (e.g. stored forecast fits) list those
+# files as state; their current contents are part of the key as well.
+#
+# Cache files are written to a temp file and renamed, the metadata after the
+# pickle, and metadata that cannot be read counts as a miss, so a run killed
+# mid-write only costs a recompute. Only the newest key of each stage is kept.
+
+CACHE_DIR = '.pipeline_cache'
+
+
+class Stage:
+    """A single pipeline step: func(*input_files, *dependency_outputs)"""
+
+    def __init__(self, name, func, deps=(), inputs=(), cache=True, state=(), input_hashes=False):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.inputs = tuple(inputs)
+        self.cache = cache
+        # Files or directories the stage reads and rewrites itself; missing ones are fine
+        self.state = tuple(state)
+        # Also pass input_hashes={path: hash} as taken when the run started, i.e. what the run used
+        self.input_hashes = input_hashes
+
+
+def hash_file(path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_value(value):
+    """Stable content hash for a stage output"""
+    digest = hashlib.sha256()
+    if isinstance(value, pd.DataFrame):
+        digest.update(repr(list(value.columns)).encode())
+        digest.update(repr(list(value.dtypes.astype(str))).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    elif value is None:
+        digest.update(b'None')
+    else:
+        digest.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    return digest.hexdigest()
+
+
+def hash_path(path):
+    """Content hash of a file or a directory tree; None if it does not exist"""
+    if os.path.isfile(path):
+        return hash_file(path)
+    if not os.path.isdir(path):
+        return None
+    digest = hashlib.sha256()
+    for directory, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(directory, name)
+            digest.update(os.path.relpath(file_path, path).encode())
+            digest.update(hash_file(file_path).encode())
+    return digest.hexdigest()
+
+
+def _project_files(module):
+    """Source files of module and of every module it imports, directly or not, from the same directory"""
+    root = os.path.dirname(os.path.abspath(module.__file__))
+    found = set()
+    pending = [module]
+    while pending:
+        current = pending.pop()
+        path = os.path.abspath(current.__file__)
+        if path in found:
+            continue
+        found.add(path)
+        for value in vars(current).values():
+            if inspect.isfunction(value) or inspect.isclass(value):
+                value = inspect.getmodule(value)
+            path = getattr(value, '__file__', None) if inspect.ismodule(value) else None
+            if path and os.path.dirname(os.path.abspath(path)) == root:
+                pending.append(value)
+    return sorted(found)
+
+
+_file_hashes = {}
+
+
+def source_hash(module):
+    """
+    Hash of the source of module and every project module it imports.
+
+    Keyed by file, so a script run as __main__ hashes the same as when it
+    is imported. Memoized per process: the code that is running does not
+    change either.
+    """
+    path = os.path.abspath(module.__file__)
+    if path not in _file_hashes:
+        digest = hashlib.sha256()
+        for source in _project_files(module):
+            digest.update(os.path.basename(source).encode())
+            digest.update(hash_file(source).encode())
+        _file_hashes[path] = digest.hexdigest()
+    return _file_hashes[path]
+
+
+def _code_hash(func):
+    module = inspect.getmodule(func)
+    if module is None or getattr(module, '__file__', None) is None:
+        return hashlib.sha256(f"{func.__module__}.{func.__qualname__}".encode()).hexdigest()
+    # The function name keeps stages that share a module apart
+    return hashlib.sha256(f"{source_hash(module)}:{func.__qualname__}".encode()).hexdigest()
+
+
+def _stage_key(stage, dep_hashes, file_hashes):
+    payload = json.dumps({
+        'stage': stage.name,
+        'code': _code_hash(stage.func),
+        'inputs': file_hashes,
+        'deps': dep_hashes,
+        'state': {path: hash_path(path) for path in stage.state},
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+
+def _replace_file(path, write, mode='w'):
+    """Call write(file_obj) on path + '.tmp', then rename it over path"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, mode) as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def _read_output_hash(meta_path):
+    """Output hash recorded for a cached stage; None if missing or unreadable"""
+    try:
+        with open(meta_path) as f:
+            return json.load(f)['output_hash']
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _prune(cache_dir, name, key):
+    """Remove every cache file of stage name except the ones for key"""
+    for entry in os.scandir(cache_dir):
+        stem, _, rest = entry.name.rpartition('-')
+        if stem == name and not rest.startswith(key + '.'):
+            os.remove(entry.path)
+
+
+def _run_stage(func, args, kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _check_graph(stages):
+    by_name = {}
+    for stage in stages:
+        if stage.name in by_name:
+            raise ValueError(f"Duplicate stage name: {stage.name}")
+        by_name[stage.name] = stage
+    for stage in stages:
+        for dep in stage.deps:
+            if dep not in by_name:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'")
+
+    # Kahn's algorithm just to reject cycles up front
+    indegree = {s.name: len(s.deps) for s in stages}
+    ready = [name for name, n in indegree.items() if n == 0]
+    seen = 0
+    while ready:
+        name = ready.pop()
+        seen += 1
+        for other in stages:
+            if name in other.deps:
+                indegree[other.name] -= 1
+                if indegree[other.name] == 0:
+                    ready.append(other.name)
+    if seen != len(stages):
+        raise ValueError("Pipeline stages contain a cycle")
+    return by_name
+
+
+def run_dag(stages, cache_dir=CACHE_DIR, max_workers=None, use_processes=True, verbose=True):
+    """
+    Run stages in dependency order, concurrently where possible.
+
+    Returns a dict of stage name -> output. Outputs of cached stages are only
+    loaded from disk when a downstream stage actually needs to run, or when
+    they are requested in the returned dict (loaded lazily at the end).
+    """
+    by_name = _check_graph(stages)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    file_hashes = {}
+    for stage in stages:
+        for path in stage.inputs:
+            if path not in file_hashes:
+                file_hashes[path] = hash_file(path)
+
+    out_hash = {}    # stage name -> output hash
+    values = {}      # stage name -> output (only when materialized)
+    cache_paths = {} # stage name -> pickle path of a cached output
+    timings = {}
+
+    pending = {s.name for s in stages}
+    running = {}     # future -> (stage name, key, pickle path, meta path)
+
+    def value_of(name):
+        if name not in values:
+            with open(cache_paths[name], 'rb') as f:
+                values[name] = pickle.load(f)
+        return values[name]
+
+    def schedule(stage):
+        name = stage.name
+        key = _stage_key(stage,
+                         {dep: out_hash[dep] for dep in stage.deps},
+                         {path: file_hashes[path] for path in stage.inputs})
+        pkl_path = os.path.join(cache_dir, f"{name}-{key}.pkl")
+        meta_path = os.path.join(cache_dir, f"{name}-{key}.json")
+
+        output_hash = _read_output_hash(meta_path) if stage.cache and os.path.exists(pkl_path) else None
+        if output_hash is not None:
+            out_hash[name] = output_hash
+            cache_paths[name] = pkl_path
+            _prune(cache_dir, name, key)
+            timings[name] = 0.0
+            if verbose:
+                print(f"  [cached] {name}")
+            return
+
+        args = list(stage.inputs) + [value_of(dep) for dep in stage.deps]
+        kwargs = {'input_hashes': {path: file_hashes[path] for path in stage.inputs}} if stage.input_hashes else {}
+        future = pool.submit(_run_stage, stage.func, args, kwargs)
+        running[future] = (name, key, pkl_path, meta_path)
+
+    Executor = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    wall_start = time.perf_counter()
+
+    with Executor(max_workers=max_workers) as pool:
+        while pending or running:
+            # Schedule every stage whose dependencies are done; cache hits
+            # resolve immediately, so keep sweeping until nothing changes
+            progressed = True
+            while progressed:
+                progressed = False
+                for name in sorted(pending):
+                    stage = by_name[name]
+                    if not all(dep in out_hash for dep in stage.deps):
+                        continue
+                    pending.discard(name)
+                    progressed = True
+                    schedule(stage)
+
+            if not running:
+                if pending:
+                    raise RuntimeError(f"Unschedulable stages: {sorted(pending)}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, key, pkl_path, meta_path = running.pop(future)
+                result, elapsed = future.result()
+                values[name] = result
+                out_hash[name] = hash_value(result)
+                timings[name] = elapsed
+                if by_name[name].cache:
+                    _replace_file(pkl_path, lambda f: pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL),
+                                  mode='wb')
+                    # The metadata marks the entry complete, so it goes last
+                    _replace_file(meta_path, lambda f: json.dump({'output_hash': out_hash[name],
+                                                                  'seconds': elapsed}, f))
+                    cache_paths[name] = pkl_path
+                    _prune(cache_dir, name, key)
+                if verbose:
+                    print(f"  [ran]    {name} ({elapsed:.2f}s)")
+
+    if verbose:
+        total = time.perf_counter() - wall_start
+        print(f"  Pipeline wall time: {total:.2f}s "
+              f"(sum of stage times: {sum(timings.values()):.2f}s)")
+
+    return {name: value_of(name) for name in by_name}
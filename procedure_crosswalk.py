@@ -0,0 +1,137 @@
+import os
+import re
+from collections import defaultdict
+
+import pandas as pd
+
+# Crosswalk between CIHI `Procedure` names and Fraser Institute `Indicator` labels.
+#
+# Names are normalized into word tokens and character trigrams. An inverted
+# index over the target vocabulary (the blocking index) means each source name
+# is only scored against targets that share a selective token or trigram,
+# instead of against every target. Manual overrides always win and can also
+# pin a procedure as explicitly unmatched (empty Fraser_Indicator).
+
+CROSSWALK_FILE = 'procedure_crosswalk.csv'
+OVERRIDES_FILE = 'procedure_crosswalk_overrides.csv'
+
+# Minimum trigram similarity for an automatic match
+MATCH_THRESHOLD = 0.85
+
+# A blocking key shared by more than this share of targets is not selective
+MAX_KEY_SHARE = 0.5
+
+STOPWORDS = {'and', 'or', 'of', 'the', 'for', 'with', 'to', 'a', 'an'}
+
+
+def normalize_name(name):
+    """Lowercase word tokens without punctuation, stopwords or repeated spaces"""
+    tokens = re.findall(r'[a-z0-9]+', str(name).lower())
+    return ' '.join(t for t in tokens if t not in STOPWORDS)
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _similarity(a, b):
+    """Dice coefficient of two trigram sets"""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+class BlockingIndex:
+    """Inverted index from tokens and trigrams to target names"""
+
+    def __init__(self, targets):
+        self.targets = list(dict.fromkeys(targets))
+        self.grams = [_trigrams(normalize_name(t)) for t in self.targets]
+        self.postings = defaultdict(set)
+        for i, target in enumerate(self.targets):
+            for key in self._keys(target):
+                self.postings[key].add(i)
+
+        limit = max(1, int(MAX_KEY_SHARE * len(self.targets)))
+        self.postings = {k: ids for k, ids in self.postings.items() if len(ids) <= limit}
+        self.comparisons = 0
+
+    @staticmethod
+    def _keys(name):
+        normalized = normalize_name(name)
+        return {('tok', t) for t in normalized.split()} | {('gram', g) for g in _trigrams(normalized)}
+
+    def candidates(self, name, min_hits=2):
+        """Targets sharing at least min_hits selective blocking keys with name"""
+        hits = defaultdict(int)
+        for key in self._keys(name):
+            for i in self.postings.get(key, ()):
+                hits[i] += 1
+        return [i for i, n in hits.items() if n >= min_hits]
+
+    def best_match(self, name):
+        """(target, score) of the best scoring candidate, or (None, 0.0)"""
+        grams = _trigrams(normalize_name(name))
+        best, best_score = None, 0.0
+        for i in self.candidates(name):
+            self.comparisons += 1
+            score = _similarity(grams, self.grams[i])
+            if score > best_score:
+                best, best_score = self.targets[i], score
+        return best, best_score
+
+
+def load_overrides(path=OVERRIDES_FILE):
+    """Manual CIHI_Procedure -> Fraser_Indicator pairs; an empty indicator means 'never match'"""
+    if not os.path.exists(path):
+        return {}
+    overrides = pd.read_csv(path, dtype=str, keep_default_na=False)
+    return {row.CIHI_Procedure: (row.Fraser_Indicator or None) for row in overrides.itertuples()}
+
+
+def build_crosswalk(cihi_procedures, fraser_indicators, overrides=None, threshold=MATCH_THRESHOLD):
+    """
+    Resolve each CIHI procedure to at most one Fraser indicator.
+
+    Returns a DataFrame with CIHI_Procedure, Fraser_Indicator, Score and
+    Match ('override', 'auto' or 'none').
+    """
+    overrides = overrides or {}
+    index = BlockingIndex(fraser_indicators)
+
+    rows = []
+    for procedure in sorted(set(cihi_procedures)):
+        if procedure in overrides:
+            rows.append((procedure, overrides[procedure], 1.0, 'override'))
+            continue
+        target, score = index.best_match(procedure)
+        if target is not None and score >= threshold:
+            rows.append((procedure, target, round(score, 3), 'auto'))
+        else:
+            rows.append((procedure, None, round(score, 3), 'none'))
+
+    crosswalk = pd.DataFrame(rows, columns=['CIHI_Procedure', 'Fraser_Indicator', 'Score', 'Match'])
+    crosswalk.attrs['comparisons'] = index.comparisons
+    return crosswalk
+
+
+def save_crosswalk(crosswalk, path=CROSSWALK_FILE):
+    crosswalk.to_csv(path, index=False)
+
+
+if __name__ == "__main__":
+    from final_merge_script import CIHI_FILE, FRASER_FILE, load_cihi, load_fraser
+
+    print("=== PROCEDURE CROSSWALK: CIHI <-> FRASER INSTITUTE ===\n")
+    cihi = load_cihi(CIHI_FILE)
+    fraser = load_fraser(FRASER_FILE)
+    procedures = cihi['Procedure'].dropna().unique()
+    indicators = fraser['Indicator'].dropna().unique()
+
+    crosswalk = build_crosswalk(procedures, indicators, load_overrides())
+    print(f"Scored {crosswalk.attrs['comparisons']} candidate pairs "
+          f"(all-pairs would be {len(procedures) * len(indicators)})")
+    print(crosswalk[crosswalk['Match'] != 'none'])
+    save_crosswalk(crosswalk)
+    print(f"\nCrosswalk saved to '{CROSSWALK_FILE}'")
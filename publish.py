@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime
+
+# Atomic publishing of pipeline outputs.
+#
+# Every file is written to a temporary file in the same directory and then
+# renamed over the target, so a reader (e.g. the Streamlit dashboard) only
+# ever sees the previous complete file or the new complete file. A manifest
+# with a monotonically increasing version is replaced last, after all the
+# tables it describes are in place. Tables whose content hash matches the
+# current manifest are not rewritten at all. A table that is empty is still
+# written (header only), and a file the new manifest no longer lists is
+# removed after the manifest is replaced, so the published files always
+# match the manifest.
+
+MANIFEST_FILE = 'outputs_manifest.json'
+
+
+def _atomic_replace(path, write, mode='w'):
+    """Call write(file_obj) on a temp file next to path, then rename it over path"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode, **({'newline': ''} if 'b' not in mode else {})) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates 0600 files; published outputs must stay readable
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_bytes(data, path):
+    _atomic_replace(path, lambda f: f.write(data), mode='wb')
+
+
+def atomic_write_csv(df, path):
+    _atomic_replace(path, lambda f: df.to_csv(f, index=False))
+
+
+def atomic_write_workbook(save, path):
+    """Call save(file_obj) to write a workbook (e.g. an xlsxwriter one) with the same temp-and-rename"""
+    _atomic_replace(path, save, mode='wb')
+
+
+def atomic_write_json(data, path):
+    _atomic_replace(path, lambda f: json.dump(data, f, indent=2))
+
+
+def read_manifest(path=MANIFEST_FILE):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def publish_outputs(tables, inputs, manifest_path=MANIFEST_FILE, store=None, code=None):
+    """
+    Atomically write each {path: DataFrame} table, then bump the manifest.
+    A value may also be the finished bytes of a file (e.g. an xlsx report),
+    which are published as they are.
+
+    inputs is {path: content hash} of the files the tables were built from,
+    as the run read them; hashing them again here could record a file that
+    was replaced mid-run.
+
+    A None table means the run produced nothing for that path: it is left
+    out of the manifest and any file still there from an earlier version is
+    removed, as is every other file only the previous manifest listed.
+
+    code is a hash of the code that produced the tables; it is recorded
+    next to the input hashes. With a SnapshotStore, the tables are also
+    recorded as an immutable version and the manifest points at it.
+    Returns the new manifest.
+    """
+    previous = read_manifest(manifest_path)
+    previous_outputs = previous['outputs'] if previous else {}
+
+    outputs = {}
+    for path, df in tables.items():
+        if df is None:
+            continue
+        data = df if isinstance(df, bytes) else df.to_csv(index=False).encode()
+        digest = hashlib.sha256(data).hexdigest()
+        if store is not None:
+            store.put(data, os.path.splitext(path)[1])
+        unchanged = previous_outputs.get(path, {}).get('sha256') == digest and os.path.exists(path)
+        if not unchanged:
+            atomic_write_bytes(data, path)
+        outputs[path] = {'sha256': digest}
+        outputs[path].update({'bytes': len(data)} if isinstance(df, bytes) else {'rows': int(len(df))})
+
+    input_hashes = dict(inputs)
+    manifest = {
+        'version': (previous['version'] + 1) if previous else 1,
+        'published_at': datetime.now().isoformat(timespec='seconds'),
+        'inputs': input_hashes,
+        'code': code,
+        'outputs': outputs,
+    }
+    if store is not None:
+        snapshot = store.commit({path: out['sha256'] for path, out in outputs.items()}, input_hashes)
+        manifest['snapshot'] = snapshot['id']
+    atomic_write_json(manifest, manifest_path)
+
+    # Only after the new manifest is in place, so the old one never lists a missing file
+    for path in set(previous_outputs) | set(tables):
+        if path not in outputs and os.path.exists(path):
+            os.remove(path)
+    return manifest
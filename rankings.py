@@ -0,0 +1,156 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from publish import atomic_write_bytes
+
+# Percentile ranks of providers (surgeons) and facilities among their peers.
+#
+# Peers are everyone of the same kind with a value for the same Procedure,
+# Period and Metric (and Specialty, so that each specialty's 'All' row is
+# ranked separately). Ranks are computed for all peer groups at once with a
+# grouped rank; Rank 1 is the shortest wait and Percentile runs from 0
+# (shortest) to 100 (longest).
+#
+# Every peer group gets an order-independent content hash. With a state file,
+# only groups that are new or whose rows changed (a new quarter, a replaced
+# rolling window) are re-ranked; the rest are carried over from the last run.
+# RankIndex gives O(1) lookups into the result for the dashboard.
+
+RANKINGS_FILE = 'provider_facility_rankings.csv'
+RANKING_STATE_FILE = '.ranking_state.pkl'
+
+METRICS = ['Surgery_Median', 'Surgery_90th']
+GROUP_KEYS = ['Entity_Type', 'Specialty', 'Procedure', 'Period', 'Metric']
+LOOKUP_KEYS = ['Entity_Type', 'Entity', 'Procedure', 'Period', 'Metric']
+COLUMNS = LOOKUP_KEYS[:2] + ['Specialty'] + LOOKUP_KEYS[2:] + ['Value', 'Rank', 'Peers', 'Percentile']
+
+# Facility rows that are aggregates rather than hospitals
+AGGREGATE_FACILITIES = ['Provincial']
+
+
+def entity_values(cihi_clean):
+    """Long table of one value per entity, procedure, period and metric"""
+    providers = cihi_clean[cihi_clean['Provider'].notna()].assign(Entity_Type='Provider', Entity=cihi_clean['Provider'])
+    facilities = cihi_clean[cihi_clean['Facility'].notna() & ~cihi_clean['Facility'].isin(AGGREGATE_FACILITIES)]
+    facilities = facilities.assign(Entity_Type='Facility', Entity=facilities['Facility'], Specialty=np.nan)
+    entities = pd.concat([providers, facilities], ignore_index=True)
+
+    long = entities.melt(id_vars=['Entity_Type', 'Entity', 'Specialty', 'Procedure', 'Period'],
+                         value_vars=METRICS, var_name='Metric', value_name='Value')
+    long['Value'] = pd.to_numeric(long['Value'], errors='coerce')
+    return long.dropna(subset=['Value']).reset_index(drop=True)
+
+
+def _group_ids(long):
+    return pd.util.hash_pandas_object(long[GROUP_KEYS], index=False).to_numpy()
+
+
+def _group_hashes(long, group_ids):
+    """Content hash per peer group; a sum of row hashes, so row order does not matter"""
+    row_hashes = pd.util.hash_pandas_object(long[['Entity', 'Value']], index=False).to_numpy()
+    # uint64 addition wraps around, which is fine for a hash
+    return pd.Series(row_hashes).groupby(group_ids).sum()
+
+
+def rank_groups(long, group_ids):
+    """Rank, peer count and percentile within each group, for all groups at once"""
+    by_group = long['Value'].groupby(group_ids)
+    ranked = long.copy()
+    ranked['Rank'] = by_group.rank(method='min').astype(int)
+    ranked['Peers'] = by_group.transform('size').astype(int)
+    average_rank = by_group.rank(method='average')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ranked['Percentile'] = np.where(ranked['Peers'] > 1,
+                                        (average_rank - 1) / (ranked['Peers'] - 1) * 100, np.nan)
+    ranked['Percentile'] = ranked['Percentile'].round(1)
+    return ranked
+
+
+def _load_state(path):
+    if path is None or not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def rank_entities(cihi_clean, state_path=None):
+    """
+    Percentile ranks for every provider and facility.
+
+    With state_path, peer groups whose rows are unchanged since the last run
+    are taken from the stored result instead of being re-ranked. The returned
+    table has attrs['reranked_groups'] and attrs['total_groups'].
+    """
+    long = entity_values(cihi_clean)
+    group_ids = _group_ids(long)
+    hashes = _group_hashes(long, group_ids)
+
+    previous = _load_state(state_path)
+    if previous is not None:
+        previous_hashes = previous['hashes'].reindex(hashes.index)
+        unchanged = hashes.index[(previous_hashes == hashes).to_numpy()]
+    else:
+        unchanged = hashes.index[:0]
+
+    stale = ~np.isin(group_ids, unchanged)
+    fresh = rank_groups(long[stale].reset_index(drop=True), group_ids[stale])
+    parts = [fresh.assign(_group=group_ids[stale])]
+    if len(unchanged):
+        kept = previous['rankings']
+        parts.append(kept[np.isin(kept['_group'].to_numpy(), unchanged)])
+    rankings = pd.concat(parts, ignore_index=True)
+
+    # Left untouched when nothing changed, so the file (and caches keyed on it) stay stable
+    same_groups = previous is not None and len(unchanged) == len(hashes) == len(previous['hashes'])
+    if state_path is not None and not same_groups:
+        state = {'hashes': hashes, 'rankings': rankings}
+        atomic_write_bytes(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL), state_path)
+
+    result = rankings[COLUMNS].sort_values(LOOKUP_KEYS, ignore_index=True)
+    result.attrs['reranked_groups'] = len(hashes) - len(unchanged)
+    result.attrs['total_groups'] = len(hashes)
+    return result
+
+
+class RankIndex:
+    """O(1) lookups into a rankings table, by entity or by (entity, procedure, period, metric)"""
+
+    def __init__(self, rankings):
+        self.rankings = rankings.reset_index(drop=True)
+        keys = zip(*(self.rankings[column] for column in LOOKUP_KEYS))
+        self._rows = {key: row for row, key in enumerate(keys)}
+        self._entities = self.rankings.groupby(['Entity_Type', 'Entity']).indices
+
+    def lookup(self, entity_type, entity, procedure, period, metric='Surgery_Median'):
+        """The ranking row as a dict, or None if the entity has no value there"""
+        row = self._rows.get((entity_type, entity, procedure, period, metric))
+        return None if row is None else self.rankings.iloc[row].to_dict()
+
+    def entities(self, entity_type):
+        return sorted(entity for kind, entity in self._entities if kind == entity_type)
+
+    def entity(self, entity_type, entity):
+        """All ranking rows for one provider or facility"""
+        rows = self._entities.get((entity_type, entity))
+        return self.rankings.iloc[rows] if rows is not None else self.rankings.iloc[:0]
+
+
+if __name__ == "__main__":
+    import time
+
+    from final_merge_script import CIHI_FILE, load_cihi
+
+    print("=== PROVIDER AND FACILITY RANKINGS ===\n")
+    cihi = load_cihi(CIHI_FILE)
+    start = time.perf_counter()
+    rankings = rank_entities(cihi)
+    print(f"{len(rankings)} ranks in {rankings.attrs['total_groups']} peer groups "
+          f"computed in {time.perf_counter() - start:.3f}s")
+
+    index = RankIndex(rankings)
+    facility = index.entities('Facility')[0]
+    print(f"\n{facility}:")
+    print(index.entity('Facility', facility).head(10))
@@ -0,0 +1,246 @@
+import argparse
+import io
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from pipeline_dag import hash_file
+from publish import atomic_write_bytes, atomic_write_csv, atomic_write_json
+
+# Archive of CIHI quarterly releases, stored as row-level deltas.
+#
+#   cihi_releases/releases.json        release list: id, label, source hash, row counts
+#   cihi_releases/r0001.parquet        the first release in full (the base)
+#   cihi_releases/r0002.parquet        rows added or changed since r0001, plus removed keys
+#
+# Every CIHI release re-ships the whole history, so consecutive releases are
+# mostly identical. A row is identified by KEY_COLUMNS plus its occurrence
+# number among rows with the same key (Specialty summary rows share an empty
+# Procedure/Provider/Facility), so row order within a file does not matter.
+# Each delta holds an 'upsert' row for every key that is new or whose values
+# changed and a 'delete' row for every key that disappeared. Deltas are
+# zstd-compressed Parquet, where the repeated labels dictionary-encode well.
+#
+# Release r is rebuilt by reading deltas 1..r, keeping the last operation per
+# key and dropping deletes: one pass over all changes so far, so storage and
+# load time grow with the amount of change rather than with the number of
+# releases. Values are kept as the exact strings from the CSV; a rebuilt
+# release has the same rows as the original file, sorted by key.
+
+ARCHIVE_DIR = 'cihi_releases'
+INDEX_FILE = 'releases.json'
+
+KEY_COLUMNS = ['Period', 'Procedure', 'Provider', 'Facility']
+OCCURRENCE_COL = '_Occurrence'
+OP_COL = '_Op'
+RELEASE_COL = '_Release'
+COMPRESSION = 'zstd'
+
+
+def read_release_csv(path):
+    """A CIHI extract as exact strings (empty fields stay ''), with the occurrence column"""
+    table = pd.read_csv(path, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+    # Numbered in content order, so rows sharing a key keep their numbers when the file is reordered
+    table[OCCURRENCE_COL] = table.sort_values(list(table.columns)).groupby(KEY_COLUMNS, sort=False).cumcount()
+    return table
+
+
+def _row_hashes(table, columns):
+    return pd.util.hash_pandas_object(table[columns], index=False).to_numpy()
+
+
+def _unmatched(table, other, columns):
+    """Rows of table that have no equal row in other, comparing only columns"""
+    return table[~np.isin(_row_hashes(table, columns), _row_hashes(other, columns))]
+
+
+def compute_delta(previous, current):
+    """Upsert rows for new or changed keys and delete rows for removed keys"""
+    keys = KEY_COLUMNS + [OCCURRENCE_COL]
+    if previous is None:
+        upserts = current
+        deletes = current.iloc[:0]
+    else:
+        # A row whose key and values both match the previous release is unchanged
+        upserts = _unmatched(current, previous, list(current.columns))
+        deletes = _unmatched(previous, current, keys)
+
+    delta = pd.concat([upserts.assign(**{OP_COL: 'upsert'}),
+                       deletes[keys].assign(**{OP_COL: 'delete'})], ignore_index=True)
+    return delta[list(current.columns) + [OP_COL]]
+
+
+class ReleaseArchive:
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_FILE)
+
+    def _index(self):
+        if not os.path.exists(self.index_path):
+            return {'columns': None, 'releases': []}
+        with open(self.index_path) as f:
+            return json.load(f)
+
+    def releases(self):
+        """All releases, oldest first"""
+        return self._index()['releases']
+
+    def _position(self, release_id):
+        ids = [release['id'] for release in self.releases()]
+        if not ids:
+            raise KeyError("Release archive is empty")
+        if release_id == 'latest':
+            return len(ids) - 1
+        if release_id not in ids:
+            raise KeyError(f"Unknown release: {release_id}")
+        return ids.index(release_id)
+
+    def _delta_path(self, release_id):
+        return os.path.join(self.root, f"{release_id}.parquet")
+
+    def add(self, path, label=None):
+        """
+        Archive a CIHI extract as a new release.
+
+        A file whose contents are already archived is not added again; the
+        existing release is returned. Raises ValueError if the columns differ
+        from the archived releases.
+        """
+        index = self._index()
+        digest = hash_file(path)
+        for release in index['releases']:
+            if release['sha256'] == digest:
+                return release
+
+        current = read_release_csv(path)
+        columns = [column for column in current.columns if column != OCCURRENCE_COL]
+        if index['columns'] is not None and columns != index['columns']:
+            raise ValueError(f"{path} has columns {columns}, the archive has {index['columns']}")
+
+        previous = self.load_release('latest', occurrence=True) if index['releases'] else None
+        delta = compute_delta(previous, current)
+
+        release = {
+            'id': f"r{len(index['releases']) + 1:04d}",
+            'label': label or os.path.basename(path),
+            'sha256': digest,
+            'archived_at': datetime.now().isoformat(timespec='seconds'),
+            'rows': len(current),
+            'upserts': int((delta[OP_COL] == 'upsert').sum()),
+            'deletes': int((delta[OP_COL] == 'delete').sum()),
+        }
+        buffer = io.BytesIO()
+        pq.write_table(pa.Table.from_pandas(delta, preserve_index=False), buffer, compression=COMPRESSION)
+        os.makedirs(self.root, exist_ok=True)
+        atomic_write_bytes(buffer.getvalue(), self._delta_path(release['id']))
+        # The index is replaced last, so a release only exists once its delta is on disk
+        atomic_write_json({'columns': columns, 'releases': index['releases'] + [release]}, self.index_path)
+        return release
+
+    def _changes(self, first, last):
+        """Delta rows of releases first..last (positions, inclusive), tagged with their position"""
+        releases = self.releases()[first:last + 1]
+        parts = [pq.read_table(self._delta_path(release['id'])).to_pandas().assign(**{RELEASE_COL: first + i})
+                 for i, release in enumerate(releases)]
+        return pd.concat(parts, ignore_index=True)
+
+    @staticmethod
+    def _apply(changes):
+        """Rows alive after applying changes in release order"""
+        latest = changes.sort_values(RELEASE_COL, kind='stable').drop_duplicates(
+            KEY_COLUMNS + [OCCURRENCE_COL], keep='last')
+        return latest[latest[OP_COL] == 'upsert'].drop(columns=[OP_COL, RELEASE_COL])
+
+    def load_release(self, release_id='latest', occurrence=False):
+        """Rebuild one release ('latest' or an id like 'r0003') as a DataFrame of strings"""
+        table = self._apply(self._changes(0, self._position(release_id)))
+        table = table.sort_values(KEY_COLUMNS + [OCCURRENCE_COL], ignore_index=True)
+        return table if occurrence else table.drop(columns=[OCCURRENCE_COL])
+
+    def diff(self, old_id, new_id):
+        """
+        Rows added, removed or changed between two releases.
+
+        Only keys touched by the deltas in between are compared. Returns the
+        key columns, Change ('added', 'removed' or 'changed') and every value
+        column as <column>_old / <column>_new.
+        """
+        old, new = self._position(old_id), self._position(new_id)
+        keys = KEY_COLUMNS + [OCCURRENCE_COL]
+        changes = self._changes(0, max(old, new))
+        touched = changes.loc[changes[RELEASE_COL] > min(old, new), keys].drop_duplicates()
+
+        def state(position):
+            alive = self._apply(changes[changes[RELEASE_COL] <= position])
+            return alive.merge(touched, on=keys)
+
+        merged = state(old).merge(state(new), on=keys, how='outer', suffixes=('_old', '_new'), indicator=True)
+        values = [column for column in self._index()['columns'] if column not in KEY_COLUMNS]
+        differs = pd.Series(False, index=merged.index)
+        for column in values:
+            differs |= merged[f"{column}_old"].ne(merged[f"{column}_new"])
+        merged['Change'] = merged['_merge'].astype(str).map({'left_only': 'removed', 'right_only': 'added', 'both': 'changed'})
+        # A key can change and change back between the two releases
+        merged = merged[(merged['_merge'] != 'both') | differs]
+
+        ordered = KEY_COLUMNS + ['Change'] + [f"{column}_{side}" for column in values for side in ('old', 'new')]
+        return merged.sort_values(keys, ignore_index=True)[ordered]
+
+
+def print_releases(archive):
+    releases = archive.releases()
+    if not releases:
+        print("No releases archived yet")
+    stored = 0
+    for release in releases:
+        size = os.path.getsize(archive._delta_path(release['id']))
+        stored += size
+        print(f"{release['id']}  {release['archived_at']}  {release['label']:<40} {release['rows']:>8} rows  "
+              f"+{release['upserts']} upserts, -{release['deletes']} deletes  ({size / 1024:.0f} KB)")
+    if releases:
+        print(f"\n{len(releases)} releases in {stored / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delta-encoded archive of CIHI quarterly releases")
+    parser.add_argument('--root', default=ARCHIVE_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help="Archive a CIHI extract as the next release")
+    add.add_argument('path')
+    add.add_argument('--label')
+    commands.add_parser('list', help="List archived releases")
+    export = commands.add_parser('export', help="Rebuild a release as CSV")
+    export.add_argument('release')
+    export.add_argument('output')
+    compare = commands.add_parser('diff', help="Rows that changed between two releases")
+    compare.add_argument('old')
+    compare.add_argument('new')
+    compare.add_argument('--output', help="Write the differences to this CSV")
+    args = parser.parse_args()
+
+    archive = ReleaseArchive(args.root)
+    print("=== CIHI RELEASE ARCHIVE ===\n")
+    if args.command == 'add':
+        release = archive.add(args.path, args.label)
+        print(f"{args.path} archived as {release['id']} "
+              f"({release['upserts']} upserts, {release['deletes']} deletes)")
+    elif args.command == 'list':
+        print_releases(archive)
+    elif args.command == 'export':
+        table = archive.load_release(args.release)
+        atomic_write_csv(table, args.output)
+        print(f"{args.release}: {len(table)} rows written to '{args.output}'")
+    else:
+        changes = archive.diff(args.old, args.new)
+        print(f"{args.old} -> {args.new}: " + (', '.join(
+            f"{count} {kind}" for kind, count in changes['Change'].value_counts().items()) or "no changes"))
+        if args.output:
+            atomic_write_csv(changes, args.output)
+            print(f"Differences written to '{args.output}'")
+        else:
+            print(changes.head(20).to_string())
@@ -0,0 +1,141 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from publish import atomic_write_bytes, atomic_write_json
+
+# Versioned, content-addressed snapshots of the pipeline outputs.
+#
+#   snapshots/objects/ab/abcdef....csv.gz   one object per distinct table content
+#   snapshots/objects/cd/cdef01....xlsx.gz  other published files keep their extension
+#   snapshots/versions/v00001.json         table name -> object hash, inputs, parent
+#   snapshots/LATEST                       id of the newest version
+#
+# Objects are immutable and keyed by the SHA-256 of the CSV bytes, so a table
+# that did not change between runs is stored once and never rewritten; a new
+# version costs one small JSON file plus the tables that actually changed.
+# A run whose tables are all identical to the latest version creates no version.
+# Files that are not tables (the xlsx report) are versioned the same way under
+# their published name; load_file returns their bytes.
+
+SNAPSHOT_DIR = 'snapshots'
+
+
+class SnapshotStore:
+    def __init__(self, root=SNAPSHOT_DIR):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.versions_dir = os.path.join(root, 'versions')
+        self.latest_path = os.path.join(root, 'LATEST')
+
+    # Objects
+
+    def _object_path(self, digest, suffix='.csv'):
+        return os.path.join(self.objects_dir, digest[:2], f"{digest}{suffix}.gz")
+
+    def put(self, data, suffix='.csv'):
+        """Store file bytes (CSV by default) under their hash (no-op if already present); returns the hash"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest, suffix)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # mtime=0 keeps the compressed bytes deterministic for identical tables
+            atomic_write_bytes(gzip.compress(data, mtime=0), path)
+        return digest
+
+    def get(self, digest, suffix='.csv'):
+        with gzip.open(self._object_path(digest, suffix), 'rb') as f:
+            return f.read()
+
+    # Versions
+
+    def latest_id(self):
+        if not os.path.exists(self.latest_path):
+            return None
+        with open(self.latest_path) as f:
+            return f.read().strip() or None
+
+    def version(self, version_id='latest'):
+        if version_id == 'latest':
+            version_id = self.latest_id()
+            if version_id is None:
+                raise KeyError("Snapshot store is empty")
+        path = os.path.join(self.versions_dir, f"{version_id}.json")
+        if not os.path.exists(path):
+            raise KeyError(f"Unknown snapshot version: {version_id}")
+        with open(path) as f:
+            return json.load(f)
+
+    def versions(self):
+        """All versions, oldest first"""
+        if not os.path.isdir(self.versions_dir):
+            return []
+        ids = sorted(name[:-5] for name in os.listdir(self.versions_dir) if name.endswith('.json'))
+        return [self.version(version_id) for version_id in ids]
+
+    def commit(self, tables, inputs=None):
+        """
+        Record a version for {table name: object hash}.
+
+        Returns the new version, or the latest one unchanged if it already
+        has exactly these tables.
+        """
+        latest_id = self.latest_id()
+        if latest_id is not None:
+            latest = self.version(latest_id)
+            if latest['tables'] == tables:
+                return latest
+
+        number = int(latest_id[1:]) + 1 if latest_id else 1
+        version = {
+            'id': f"v{number:05d}",
+            'parent': latest_id,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'inputs': inputs or {},
+            'tables': tables,
+        }
+        os.makedirs(self.versions_dir, exist_ok=True)
+        atomic_write_json(version, os.path.join(self.versions_dir, f"{version['id']}.json"))
+        atomic_write_bytes(version['id'].encode(), self.latest_path)
+        return version
+
+    # Reads
+
+    def load_table(self, name, version_id='latest', **read_csv_kwargs):
+        """Read one table as it was in the given version ('latest' or an id like 'v00003')"""
+        digest = self.version(version_id)['tables'][name]
+        return pd.read_csv(io.BytesIO(self.get(digest)), **read_csv_kwargs)
+
+    def load_file(self, name, version_id='latest'):
+        """Bytes of one published file (e.g. the xlsx report) as it was in the given version"""
+        digest = self.version(version_id)['tables'][name]
+        return self.get(digest, os.path.splitext(name)[1])
+
+    def diff(self, old_id, new_id):
+        """Table names added, removed or changed between two versions (hash comparison only)"""
+        old = self.version(old_id)['tables']
+        new = self.version(new_id)['tables']
+        return {
+            'added': sorted(set(new) - set(old)),
+            'removed': sorted(set(old) - set(new)),
+            'changed': sorted(name for name in set(old) & set(new) if old[name] != new[name]),
+        }
+
+
+if __name__ == "__main__":
+    store = SnapshotStore()
+    versions = store.versions()
+    print("=== OUTPUT SNAPSHOTS ===\n")
+    if not versions:
+        print("No snapshots yet - run final_merge_script.py first")
+    previous = None
+    for version in versions:
+        changes = store.diff(previous['id'], version['id']) if previous else {'added': sorted(version['tables'])}
+        summary = ', '.join(f"{kind}: {len(names)}" for kind, names in changes.items() if names) or 'no table changes'
+        print(f"{version['id']}  {version['created_at']}  ({summary})")
+        previous = version
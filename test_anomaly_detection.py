@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+from anomaly_detection import (NULL_FALSE_POSITIVE_RATE, SERIES_KEYS, detect_anomalies, detect_changepoints,
+                               quarter_index)
+
+
+def noise_series(n_series, lengths, seed, shift=0.0, spike=0.0, round_days=False):
+    """Long table of white-noise Facility x Procedure series with random levels and scales"""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(n_series):
+        length = lengths[i % len(lengths)]
+        level, scale = rng.uniform(20, 300), rng.uniform(2, 60)
+        values = level + scale * rng.standard_normal(length)
+        values[length // 2:] += shift * scale
+        values[length // 2] += spike * scale
+        frames.append(pd.DataFrame({
+            'Facility': f"Facility {i}", 'Procedure': 'Hip Replacement', 'Metric': 'Surgery_Median',
+            'Quarter_Index': quarter_index(np.full(length, 2023), np.arange(length) + 1),
+            'Value': values.round() if round_days else values,
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def flagged_share(table, n_series):
+    return table[SERIES_KEYS].drop_duplicates().shape[0] / n_series
+
+
+def test_low_false_positive_rate_on_white_noise():
+    # Real CIHI series have 8-9 quarters; longer ones cover future extracts
+    n_series = 3000
+    series = noise_series(n_series, [8, 9, 12, 20], seed=123)
+    assert flagged_share(detect_anomalies(series), n_series) < 2 * NULL_FALSE_POSITIVE_RATE
+    assert flagged_share(detect_changepoints(series), n_series) < 2 * NULL_FALSE_POSITIVE_RATE
+
+
+def test_low_false_positive_rate_on_whole_day_noise():
+    # Wait times are reported in whole days, so short, low-variance series have ties
+    n_series = 3000
+    series = noise_series(n_series, [8, 9], seed=7, round_days=True)
+    assert flagged_share(detect_anomalies(series), n_series) < 2 * NULL_FALSE_POSITIVE_RATE
+    assert flagged_share(detect_changepoints(series), n_series) < 2 * NULL_FALSE_POSITIVE_RATE
+
+
+def test_large_shift_is_found_at_the_right_quarter():
+    series = noise_series(200, [12], seed=5, shift=6.0)
+    changepoints = detect_changepoints(series)
+    assert len(changepoints) >= 190
+    assert (changepoints['Changepoint_Period'] == '2024_q3').mean() > 0.95
+    assert (changepoints['Shift_Days'] > 0).all()
+
+
+def test_large_spike_is_flagged():
+    series = noise_series(200, [9], seed=11, spike=25.0)
+    anomalies = detect_anomalies(series)
+    assert flagged_share(anomalies, 200) > 0.9
+    assert (anomalies['Period'] == '2024_q1').mean() > 0.9
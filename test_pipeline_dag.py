@@ -0,0 +1,135 @@
+import importlib
+import sys
+
+import pytest
+
+import pipeline_dag
+from pipeline_dag import Stage, run_dag
+
+# Stage functions live in modules written to a temp directory, so a test can
+# edit them the way a developer would. Every call is logged in dag_calls.CALLS.
+CALLS_SOURCE = "CALLS = []\n"
+
+STAGES_SOURCE = """\
+from dag_calls import CALLS
+
+STATE_FILE = None
+
+
+def load(path):
+    CALLS.append('load')
+    with open(path) as f:
+        return int(f.read())
+
+
+def other(path):
+    CALLS.append('other')
+    with open(path) as f:
+        return int(f.read())
+
+
+def stateful(value):
+    CALLS.append('stateful')
+    with open(STATE_FILE) as f:
+        return value + int(f.read())
+
+
+def total(doubled, other_value):
+    CALLS.append('total')
+    return doubled + other_value
+"""
+
+SCALING_SOURCE = """\
+from dag_calls import CALLS
+
+FACTOR = {factor}
+
+
+def double(value):
+    CALLS.append('double')
+    return FACTOR * value
+"""
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    (tmp_path / 'dag_calls.py').write_text(CALLS_SOURCE)
+    (tmp_path / 'dag_stages.py').write_text(STAGES_SOURCE)
+    (tmp_path / 'dag_scaling.py').write_text(SCALING_SOURCE.format(factor=2))
+    (tmp_path / 'data.txt').write_text('10')
+    (tmp_path / 'other.txt').write_text('1')
+    (tmp_path / 'state.txt').write_text('100')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    for name in ('dag_calls', 'dag_stages', 'dag_scaling'):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    # Source hashes are memoized per process; the tests edit sources in between runs
+    monkeypatch.setattr(pipeline_dag, '_file_hashes', {})
+    return tmp_path
+
+
+def run(project):
+    """Run the test pipeline; returns (outputs, names of the stages that ran)"""
+    pipeline_dag._file_hashes.clear()
+    calls = importlib.import_module('dag_calls')
+    stages = importlib.reload(importlib.import_module('dag_stages'))
+    scaling = importlib.reload(importlib.import_module('dag_scaling'))
+    stages.STATE_FILE = str(project / 'state.txt')
+    calls.CALLS.clear()
+    outputs = run_dag([
+        Stage('load', stages.load, inputs=[str(project / 'data.txt')]),
+        Stage('other', stages.other, inputs=[str(project / 'other.txt')]),
+        Stage('double', scaling.double, deps=['load']),
+        Stage('stateful', stages.stateful, deps=['load'], state=[str(project / 'state.txt')]),
+        Stage('total', stages.total, deps=['double', 'other']),
+    ], cache_dir=str(project / 'cache'), use_processes=False, verbose=False)
+    return outputs, set(calls.CALLS)
+
+
+def test_unchanged_rerun_is_fully_cached(project):
+    first, ran = run(project)
+    assert ran == {'load', 'other', 'double', 'stateful', 'total'}
+    second, ran = run(project)
+    assert ran == set()
+    assert second == first
+
+
+def test_edited_input_reruns_only_downstream_stages(project):
+    run(project)
+    (project / 'data.txt').write_text('20')
+    outputs, ran = run(project)
+    assert ran == {'load', 'double', 'stateful', 'total'}
+    assert outputs['total'] == 41
+
+
+def test_identical_output_stops_the_rerun(project):
+    run(project)
+    # Different bytes, same parsed value: load reruns, nothing after it does
+    (project / 'data.txt').write_text('10\n')
+    _, ran = run(project)
+    assert ran == {'load'}
+
+
+def test_edited_state_file_reruns_its_stage(project):
+    run(project)
+    (project / 'state.txt').write_text('200')
+    outputs, ran = run(project)
+    assert ran == {'stateful'}
+    assert outputs['stateful'] == 210
+
+
+def test_edited_module_reruns_its_stages(project):
+    run(project)
+    # A constant, not the function body: the whole module source is part of the key
+    (project / 'dag_scaling.py').write_text(SCALING_SOURCE.format(factor=3))
+    outputs, ran = run(project)
+    assert ran == {'double', 'total'}
+    assert outputs['total'] == 31
+
+
+def test_unreadable_metadata_is_a_cache_miss(project):
+    run(project)
+    for meta in (project / 'cache').glob('load-*.json'):
+        meta.write_text('')
+    _, ran = run(project)
+    assert ran == {'load'}
+    assert len(list((project / 'cache').glob('*'))) == 2 * 5
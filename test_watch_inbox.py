@@ -0,0 +1,34 @@
+import time
+
+import pytest
+
+from pipeline_dag import hash_file
+from release_archive import read_release_csv
+from watch_inbox import InboxWatcher
+
+EXTRACT = "Period,Procedure,Provider,Facility,Surgery_Median\n2024_q1,Hip Replacement,,Aberdeen Hospital,120\n"
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    watcher = InboxWatcher(str(tmp_path), debounce=0.2)
+    watcher.start()
+    yield watcher
+    watcher.stop()
+
+
+def test_writing_an_inbox_file_is_a_change(watcher, tmp_path):
+    (tmp_path / 'extract.csv').write_text(EXTRACT)
+    assert watcher.wait_for_quiet(timeout=5)
+
+
+def test_reading_an_inbox_file_is_not_a_change(watcher, tmp_path):
+    path = tmp_path / 'extract.csv'
+    path.write_text(EXTRACT)
+    assert watcher.wait_for_quiet(timeout=5)
+
+    # What a pipeline run does with the extract: hash it and archive it
+    hash_file(str(path))
+    read_release_csv(str(path))
+    time.sleep(1.5)
+    assert not watcher.changed.is_set()
@@ -0,0 +1,184 @@
+import argparse
+import glob
+import os
+import threading
+import time
+
+from final_merge_script import CIHI_FILE, FRASER_FILE, build_stages, code_version
+from pipeline_dag import hash_file, run_dag
+from procedure_crosswalk import OVERRIDES_FILE
+from publish import MANIFEST_FILE, read_manifest
+from release_archive import ReleaseArchive
+
+# Long-running watch mode for new data drops.
+#
+# New CIHI extracts (*.csv) and Fraser workbooks (*.xlsx) are dropped into an
+# inbox directory. File events are debounced so a burst (a copy in progress,
+# several files at once) triggers a single run once the inbox has been quiet.
+# The newest file of each kind is fed to the merge pipeline, whose stage cache
+# means only the branch that changed is recomputed, and outputs are published
+# atomically with a new manifest version. Every CIHI extract that arrives is
+# also kept in the delta-encoded release archive (see release_archive.py).
+#
+# watchdog is used for file events when installed; otherwise the inbox is
+# scanned once per second in a background thread.
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+INBOX_DIR = 'inbox'
+DEBOUNCE_SECONDS = 2.0
+SCAN_INTERVAL_SECONDS = 1.0
+
+
+def _is_partial(path):
+    """Temp/lock files written by copy tools, browsers and Excel"""
+    name = os.path.basename(path)
+    return (name.startswith('.') or name.startswith('~$')
+            or name.endswith(('.tmp', '.part', '.crdownload')))
+
+
+def find_inputs(inbox, cihi_default=CIHI_FILE, fraser_default=FRASER_FILE):
+    """Newest CIHI CSV and Fraser workbook in the inbox, falling back to the defaults"""
+    def newest(pattern, default):
+        files = [p for p in glob.glob(os.path.join(inbox, pattern)) if not _is_partial(p)]
+        return max(files, key=os.path.getmtime) if files else default
+
+    return newest('*.csv', cihi_default), newest('*.xlsx', fraser_default)
+
+
+def _snapshot(inbox):
+    entries = {}
+    for entry in os.scandir(inbox):
+        if entry.is_file() and not _is_partial(entry.path):
+            stat = entry.stat()
+            entries[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return entries
+
+
+class InboxWatcher:
+    """Signals changes in the inbox; call wait_for_quiet() to block until a debounced burst ends"""
+
+    def __init__(self, inbox, debounce=DEBOUNCE_SECONDS):
+        self.inbox = inbox
+        self.debounce = debounce
+        self.changed = threading.Event()
+        self.last_event = 0.0
+        # Guards last_event and changed together, so an event can't land between the check and the clear
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._observer = None
+        self._thread = None
+
+    def notify(self, path=None):
+        if path is not None and _is_partial(path):
+            return
+        with self._lock:
+            self.last_event = time.monotonic()
+            self.changed.set()
+
+    def start(self):
+        os.makedirs(self.inbox, exist_ok=True)
+        if Observer is not None:
+            watcher = self
+
+            # Only events that change a file; watchdog also reports opens and
+            # closes without a write, which our own reads of the inbox trigger
+            class Handler(FileSystemEventHandler):
+                def _changed(self, event):
+                    if not event.is_directory:
+                        watcher.notify(getattr(event, 'dest_path', None) or event.src_path)
+
+                on_created = on_modified = on_moved = on_deleted = on_closed = _changed
+
+            self._observer = Observer()
+            self._observer.schedule(Handler(), self.inbox, recursive=False)
+            self._observer.start()
+        else:
+            self._thread = threading.Thread(target=self._scan, daemon=True)
+            self._thread.start()
+
+    def _scan(self):
+        previous = _snapshot(self.inbox)
+        while not self._stop.wait(SCAN_INTERVAL_SECONDS):
+            current = _snapshot(self.inbox)
+            if current != previous:
+                previous = current
+                self.notify()
+
+    def stop(self):
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+
+    def wait_for_quiet(self, timeout=None):
+        """Block until a change has been followed by `debounce` seconds of silence"""
+        if not self.changed.wait(timeout):
+            return False
+        while True:
+            with self._lock:
+                quiet_for = time.monotonic() - self.last_event
+                if quiet_for >= self.debounce:
+                    self.changed.clear()
+                    return True
+            time.sleep(self.debounce - quiet_for)
+
+
+def run_if_changed(cihi_file, fraser_file, overrides_file=OVERRIDES_FILE, manifest_path=MANIFEST_FILE):
+    """Run the pipeline unless the last published manifest already covers these exact inputs and code"""
+    manifest = read_manifest(manifest_path)
+    current = {path: hash_file(path) for path in (cihi_file, fraser_file, overrides_file)}
+    if manifest is not None and manifest.get('inputs') == current and manifest.get('code') == code_version():
+        print("  Inputs and pipeline code unchanged since the last published version, skipping run")
+        return None
+
+    results = run_dag(build_stages(cihi_file, fraser_file, overrides_file))
+    return results['write_outputs']
+
+
+def watch(inbox=INBOX_DIR, debounce=DEBOUNCE_SECONDS):
+    watcher = InboxWatcher(inbox, debounce)
+    watcher.start()
+    print(f"=== WATCHING '{inbox}' FOR NEW DATA (Ctrl+C to stop) ===\n")
+    print(f"File events: {'watchdog' if Observer is not None else 'directory scan'}, "
+          f"debounce: {debounce:.1f}s\n")
+
+    # Catch up on anything dropped while the watcher was not running
+    watcher.notify()
+    try:
+        while True:
+            watcher.wait_for_quiet()
+            cihi_file, fraser_file = find_inputs(inbox)
+            print(f"[{time.strftime('%H:%M:%S')}] Inputs: {cihi_file}, {fraser_file}")
+            try:
+                release = ReleaseArchive().add(cihi_file)
+                print(f"  CIHI extract archived as release {release['id']} "
+                      f"({release['upserts']} upserts, {release['deletes']} deletes)")
+            except Exception as e:
+                # e.g. a changed column layout or an unreadable file; like a pipeline
+                # failure this must not stop the watcher, and the pipeline still gets to run
+                print(f"  Could not archive the CIHI extract ({type(e).__name__}): {e}")
+            try:
+                manifest = run_if_changed(cihi_file, fraser_file)
+            except Exception as e:
+                # Keep watching; the previously published version stays in place
+                print(f"  Pipeline failed, keeping the last published outputs: {e}")
+                continue
+            if manifest is not None:
+                print(f"  Published output version {manifest['version']}, snapshot {manifest['snapshot']}")
+    except KeyboardInterrupt:
+        print("\nStopping watcher")
+    finally:
+        watcher.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-run the merge pipeline when new data lands in the inbox")
+    parser.add_argument('--inbox', default=INBOX_DIR)
+    parser.add_argument('--debounce', type=float, default=DEBOUNCE_SECONDS)
+    args = parser.parse_args()
+    watch(args.inbox, args.debounce)
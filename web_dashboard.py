@@ -1,9 +1,30 @@
+import threading
+import time
+from contextlib import contextmanager
+
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import numpy as np
+import plotly.graph_objects as go
+
+from figure_templates import FigureTemplate
+from forecasting import NS_AVERAGE_INDICATOR
+from rankings import RankIndex
+from snapshot_store import SnapshotStore
+
+# The dashboard is a set of components. Each one is a fragment that declares
+# its inputs as arguments (the data version, the year range, ...), so:
+#   - a widget inside a component (e.g. the projection selectors) reruns only
+#     that component, not the whole page
+#   - the data each component draws is built by a @st.cache_data builder keyed
+#     on exactly those inputs, so a component whose inputs did not change
+#     between reruns is redrawn from cache without recomputing anything
+#   - charts come from figure templates built once per process; builders
+#     return NumPy arrays only, and a chart whose data hash is unchanged is the
+#     same Figure object again, never rebuilt or revalidated
+# Render times are recorded per component in st.session_state['render_stats'];
+# cache builds happen once per server process for all sessions, so they are
+# counted per process. Both are shown under "Render stats".
 
 # Page configuration
 st.set_page_config(
@@ -13,25 +34,440 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Title and description
-st.title("🏥 Nova Scotia Healthcare Wait Times Dashboard")
-st.markdown("""
-This dashboard analyzes healthcare wait times in Nova Scotia using data from the Fraser Institute (2008-2024) 
-and CIHI (2023-2025). Explore trends, patterns, and insights in healthcare accessibility.
-""")
+
+# Per-interaction work accounting
+
+def _stats(name):
+    stats = st.session_state.setdefault('render_stats', {})
+    return stats.setdefault(name, {'renders': 0, 'last_ms': 0.0, 'total_ms': 0.0})
+
+
+def _record_render(name, start):
+    entry = _stats(name)
+    entry['renders'] += 1
+    entry['last_ms'] = (time.perf_counter() - start) * 1000
+    entry['total_ms'] += entry['last_ms']
+
+
+@contextmanager
+def timed_component(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record_render(name, start)
+
+
+@st.cache_resource
+def build_counts():
+    """Cache builds per component in this server process, shared by all sessions"""
+    return {'lock': threading.Lock(), 'counts': {}}
+
+
+def _count_build(name):
+    # Only runs on a cache miss, i.e. when the component's inputs changed
+    builds = build_counts()
+    with builds['lock']:
+        builds['counts'][name] = builds['counts'].get(name, 0) + 1
+
 
 # Load data
 @st.cache_data
-def load_data():
-    df = pd.read_csv('merged_wait_times_nova_scotia.csv')
+def list_versions(latest_id):
+    # Keyed on the newest id (one small file read per run), so new snapshots show up without a restart
+    return [v['id'] for v in reversed(SnapshotStore().versions())]
+
+@st.cache_data
+def load_data(version='latest'):
+    # Snapshot versions are immutable, so caching by version id is always safe
+    store = SnapshotStore()
+    if store.latest_id() is not None:
+        df = store.load_table('merged_wait_times_nova_scotia.csv', version)
+    else:
+        df = pd.read_csv('merged_wait_times_nova_scotia.csv')
     df['Year'] = df['Year'].astype(int)
     return df.sort_values('Year')
 
-df = load_data()
+@st.cache_data
+def load_table(name, version):
+    """A precomputed pipeline table from a snapshot, or None if that version doesn't have it"""
+    try:
+        return SnapshotStore().load_table(name, version)
+    except KeyError:
+        return None
+
+
+# Cached builders, keyed on each component's declared inputs
+
+@st.cache_data
+def filtered_data(version, year_range):
+    df = load_data(version)
+    return df[(df['Year'] >= year_range[0]) & (df['Year'] <= year_range[1])]
+
+@st.cache_data
+def fraser_series(version, year_range):
+    return filtered_data(version, year_range).dropna(subset=['Fraser_Wait_Time_Days'])
+
+@st.cache_data
+def ns_forecasts(version):
+    forecasts = load_table('wait_time_forecasts.csv', version)
+    if forecasts is None:
+        return None
+    return forecasts[(forecasts['Province'] == 'Nova Scotia') & forecasts['Region'].isna()]
+
+# Figure templates: styles built once per server process, data swapped in per
+# request as typed arrays (see figure_templates.py)
+
+@st.cache_resource
+def trend_template():
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        mode='lines+markers',
+        name='Fraser Institute',
+        line=dict(color='#1f77b4', width=3),
+        marker=dict(size=8)
+    ))
+    fig.add_trace(go.Scatter(
+        fill='toself',
+        fillcolor='rgba(214, 39, 40, 0.15)',
+        line=dict(width=0),
+        hoverinfo='skip',
+        name='95% Prediction Interval'
+    ))
+    fig.add_trace(go.Scatter(
+        mode='lines',
+        line=dict(color='red', width=2, dash='dash')
+    ))
+    fig.add_trace(go.Scatter(
+        mode='lines+markers',
+        name='CIHI',
+        line=dict(color='#ff7f0e', width=3),
+        marker=dict(size=8)
+    ))
+    fig.update_layout(
+        title="Healthcare Wait Times Over Time",
+        xaxis_title="Year",
+        yaxis_title="Wait Time (Days)",
+        height=400,
+        hovermode='x unified'
+    )
+    return FigureTemplate(fig, ['fraser', 'interval', 'projection', 'cihi'])
+
+@st.cache_resource
+def decade_template():
+    fig = go.Figure(go.Bar())
+    fig.update_layout(
+        title="Average Wait Times by Decade",
+        xaxis_title='Decade',
+        yaxis_title='Average Wait Time (Days)',
+        height=400
+    )
+    return FigureTemplate(fig, ['decade'])
+
+@st.cache_resource
+def yoy_template():
+    fig = go.Figure(go.Bar())
+    fig.update_layout(
+        title="Year-over-Year Change in Wait Times",
+        xaxis_title='Year',
+        yaxis_title='Change in Days',
+        height=400
+    )
+    fig.add_hline(y=0, line_dash="dash", line_color="red")
+    return FigureTemplate(fig, ['yoy'])
+
+@st.cache_data
+def trend_data(version, year_range):
+    _count_build('trend')
+    data = {}
+
+    # Fraser Institute data
+    fraser_data = fraser_series(version, year_range)
+    if not fraser_data.empty:
+        years = fraser_data['Year'].to_numpy()
+        days = fraser_data['Fraser_Wait_Time_Days'].to_numpy()
+        data['fraser'] = {'x': years, 'y': days}
+
+        # Projection with 95% prediction interval (precomputed by the pipeline);
+        # it starts after the last observed year, so only show it when that is in range
+        forecasts = ns_forecasts(version)
+        in_range = load_data(version)['Year'].max() <= year_range[1]
+        if forecasts is not None and in_range:
+            headline = forecasts[forecasts['Indicator'] == NS_AVERAGE_INDICATOR].sort_values('Year')
+            if not headline.empty:
+                # Both lines start from the last observed point
+                x = np.concatenate([years[-1:], headline['Year'].to_numpy()])
+                high = np.concatenate([days[-1:], headline['PI_High'].to_numpy()])
+                low = np.concatenate([days[-1:], headline['PI_Low'].to_numpy()])
+                data['interval'] = {'x': np.concatenate([x, x[::-1]]), 'y': np.concatenate([high, low[::-1]])}
+                data['projection'] = {
+                    'x': x,
+                    'y': np.concatenate([days[-1:], headline['Forecast'].to_numpy()]),
+                    'name': f"Projection ({headline['Model'].iloc[0]})"
+                }
+
+    # CIHI data (if available)
+    cihi_data = filtered_data(version, year_range).dropna(subset=['CIHI_Surgery_Median_Days'])
+    if not cihi_data.empty:
+        data['cihi'] = {'x': cihi_data['Year'].to_numpy(), 'y': cihi_data['CIHI_Surgery_Median_Days'].to_numpy()}
+    return data
+
+@st.cache_data
+def key_statistics(version, year_range):
+    _count_build('statistics')
+    fraser_data = fraser_series(version, year_range)
+    if fraser_data.empty:
+        return {}
+    return {
+        "Mean Wait Time": f"{fraser_data['Fraser_Wait_Time_Days'].mean():.0f} days",
+        "Median Wait Time": f"{fraser_data['Fraser_Wait_Time_Days'].median():.0f} days",
+        "Min Wait Time": f"{fraser_data['Fraser_Wait_Time_Days'].min():.0f} days",
+        "Max Wait Time": f"{fraser_data['Fraser_Wait_Time_Days'].max():.0f} days",
+        "Data Points": f"{len(fraser_data)} years"
+    }
+
+@st.cache_data
+def decade_data(version, year_range):
+    _count_build('decade')
+    fraser_data = fraser_series(version, year_range)
+    if fraser_data.empty:
+        return None
+    decade_avg = fraser_data.groupby((fraser_data['Year'] // 10) * 10)['Fraser_Wait_Time_Days'].mean()
+    return {'decade': {'x': decade_avg.index.to_numpy(), 'y': decade_avg.to_numpy()}}
+
+@st.cache_data
+def yoy_data(version, year_range):
+    _count_build('yoy')
+    fraser_data = fraser_series(version, year_range)
+    if len(fraser_data) <= 1:
+        return None
+    yoy_change = fraser_data['Fraser_Wait_Time_Days'].diff()
+    return {'yoy': {'x': fraser_data['Year'].to_numpy()[1:], 'y': yoy_change.to_numpy()[1:]}}
+
+@st.cache_data
+def filtered_csv(version, year_range):
+    _count_build('raw_data')
+    return filtered_data(version, year_range).to_csv(index=False)
+
+@st.cache_data
+def insight_averages(version, year_range):
+    _count_build('insights')
+    fraser_data = fraser_series(version, year_range)
+    if fraser_data.empty:
+        return None
+    recent_avg = fraser_data[fraser_data['Year'] >= 2020]['Fraser_Wait_Time_Days'].mean()
+    older_avg = fraser_data[fraser_data['Year'] <= 2014]['Fraser_Wait_Time_Days'].mean()
+    return recent_avg, older_avg
+
+@st.cache_data
+def projection_table(version, indicator, metric):
+    _count_build('projections')
+    detail = ns_forecasts(version)
+    projection = detail[(detail['Indicator'] == indicator) & (detail['Metric'] == metric)].sort_values('Year')
+    return projection[['Year', 'Forecast', 'PI_Low', 'PI_High', 'Model', 'Alpha', 'Beta', 'Phi']].round(2)
+
+
+@st.cache_resource
+def rank_index(version):
+    # One index per data version and server process, shared by all sessions (read-only)
+    rankings = load_table('provider_facility_rankings.csv', version)
+    return RankIndex(rankings) if rankings is not None and not rankings.empty else None
+
+
+# Components
+
+@st.fragment
+def trend_component(version, year_range):
+    with timed_component('trend'):
+        st.subheader("📈 Wait Time Trends")
+        st.plotly_chart(trend_template().render(trend_data(version, year_range)), use_container_width=True)
+
+@st.fragment
+def statistics_component(version, year_range):
+    with timed_component('statistics'):
+        st.subheader("📊 Key Statistics")
+        for metric, value in key_statistics(version, year_range).items():
+            st.metric(metric, value)
+
+@st.fragment
+def decade_component(version, year_range):
+    with timed_component('decade'):
+        st.subheader("📊 Decade Analysis")
+        data = decade_data(version, year_range)
+        if data is not None:
+            st.plotly_chart(decade_template().render(data), use_container_width=True)
+
+@st.fragment
+def yoy_component(version, year_range):
+    with timed_component('yoy'):
+        st.subheader("📈 Year-over-Year Changes")
+        data = yoy_data(version, year_range)
+        if data is not None:
+            st.plotly_chart(yoy_template().render(data), use_container_width=True)
+
+@st.fragment
+def raw_data_component(version, year_range):
+    with timed_component('raw_data'):
+        st.subheader("📋 Raw Data")
+
+        # Add download button
+        st.download_button(
+            label="📥 Download filtered data as CSV",
+            data=filtered_csv(version, year_range),
+            file_name=f'wait_times_{year_range[0]}_{year_range[1]}.csv',
+            mime='text/csv'
+        )
+
+        # Display data table
+        st.dataframe(
+            filtered_data(version, year_range),
+            use_container_width=True,
+            hide_index=True
+        )
+
+@st.fragment
+def insights_component(version, year_range):
+    with timed_component('insights'):
+        st.subheader("🔍 Key Insights")
+
+        averages = insight_averages(version, year_range)
+        if averages is None:
+            return
+        recent_avg, older_avg = averages
+
+        col5, col6, col7 = st.columns(3)
+
+        with col5:
+            st.info(f"**Recent Trend (2020-2024):** {recent_avg:.0f} days average")
+
+        with col6:
+            st.info(f"**Historical Average (2010-2014):** {older_avg:.0f} days average")
+
+        with col7:
+            change_pct = ((recent_avg - older_avg) / older_avg * 100) if older_avg > 0 else 0
+            st.info(f"**Change:** {change_pct:+.1f}%")
+
+@st.fragment
+def projections_component(version):
+    # The selectors live inside the fragment, so changing them reruns only this component
+    forecasts = ns_forecasts(version)
+    if forecasts is None or forecasts.empty:
+        return
+    with timed_component('projections'):
+        st.markdown("---")
+        st.subheader("🔮 Projected Wait Times")
+        st.caption("Exponential smoothing or damped-trend model per Fraser series (chosen by AIC), "
+                   "with 95% prediction intervals")
+
+        detail = forecasts[forecasts['Indicator'] != NS_AVERAGE_INDICATOR]
+        col10, col11 = st.columns(2)
+        with col10:
+            indicator = st.selectbox("Indicator", sorted(detail['Indicator'].unique()))
+        with col11:
+            metric = st.selectbox("Metric", sorted(detail.loc[detail['Indicator'] == indicator, 'Metric'].unique()))
+
+        st.dataframe(projection_table(version, indicator, metric), use_container_width=True, hide_index=True)
+
+@st.fragment
+def anomalies_component(version):
+    # Anomalies and changepoints (precomputed by the nightly pipeline)
+    anomalies = load_table('wait_time_anomalies.csv', version)
+    changepoints = load_table('wait_time_changepoints.csv', version)
+    if anomalies is None and changepoints is None:
+        return
+
+    with timed_component('anomalies'):
+        st.markdown("---")
+        st.subheader("🚨 Unusual Quarters and Structural Changes")
+        st.caption("Facility × procedure series from CIHI quarterly data: outliers by robust z-score, "
+                   "changepoints by the best single mean shift")
+
+        col8, col9 = st.columns(2)
+
+        with col8:
+            st.markdown("**Outlier quarters**")
+            if anomalies is not None and not anomalies.empty:
+                st.dataframe(anomalies.head(50), use_container_width=True, hide_index=True)
+            else:
+                st.write("No outlier quarters detected")
+
+        with col9:
+            st.markdown("**Changepoints**")
+            if changepoints is not None and not changepoints.empty:
+                st.dataframe(changepoints.head(50), use_container_width=True, hide_index=True)
+            else:
+                st.write("No changepoints detected")
+
+@st.fragment
+def rankings_component(version):
+    index = rank_index(version)
+    if index is None:
+        return
+    with timed_component('rankings'):
+        st.markdown("---")
+        st.subheader("🏅 Provider and Facility Rankings")
+        st.caption("Percentile among peers with the same procedure and period: "
+                   "0 = shortest wait, 100 = longest; rank 1 is the shortest wait")
+
+        col12, col13, col14 = st.columns(3)
+        with col12:
+            entity_type = st.radio("Rank", ['Facility', 'Provider'], horizontal=True)
+        with col13:
+            entity = st.selectbox(entity_type, index.entities(entity_type))
+        with col14:
+            metric = st.selectbox("Wait time", ['Surgery_Median', 'Surgery_90th'],
+                                  format_func=lambda m: m.replace('Surgery_', 'Surgery ').replace('90th', '90th percentile'))
+
+        ranks = index.entity(entity_type, entity)
+        ranks = ranks[ranks['Metric'] == metric]
+        st.dataframe(
+            ranks[['Procedure', 'Period', 'Value', 'Rank', 'Peers', 'Percentile']]
+            .sort_values(['Procedure', 'Period']),
+            use_container_width=True, hide_index=True
+        )
+
+def render_stats_panel():
+    # Drawn at the end of each full run; fragment-only reruns update the counts for the next one
+    with st.sidebar.expander("⏱ Render stats"):
+        st.caption("Per component: renders and render time in this session")
+        stats = st.session_state.get('render_stats', {})
+        if stats:
+            st.dataframe(pd.DataFrame.from_dict(stats, orient='index').round(1), use_container_width=True)
+        st.caption("Per component: cache builds (new inputs) by this server process, for all sessions")
+        counts = build_counts()['counts']
+        if counts:
+            st.dataframe(pd.Series(counts, name='builds').to_frame(), use_container_width=True)
+        st.caption("Figures built vs. reused (unchanged data) by this server process")
+        templates = {'trend': trend_template(), 'decade': decade_template(), 'yoy': yoy_template()}
+        st.dataframe(pd.DataFrame({name: {'builds': t.builds, 'reused': t.hits} for name, t in templates.items()}),
+                     use_container_width=True)
+
+
+run_start = time.perf_counter()
+
+# Title and description
+st.title("🏥 Nova Scotia Healthcare Wait Times Dashboard")
+st.markdown("""
+This dashboard analyzes healthcare wait times in Nova Scotia using data from the Fraser Institute (2008-2024)
+and CIHI (2023-2025). Explore trends, patterns, and insights in healthcare accessibility.
+""")
 
 # Sidebar filters
 st.sidebar.header("📊 Dashboard Filters")
 
+# Data version (time travel through published snapshots)
+latest_id = SnapshotStore().latest_id()
+versions = list_versions(latest_id)
+selected_version = st.sidebar.selectbox(
+    "Data Version",
+    options=['latest'] + versions,
+    help="Published pipeline snapshots, newest first"
+) if versions else 'latest'
+if selected_version == 'latest' and versions:
+    selected_version = latest_id
+
+df = load_data(selected_version)
+
 # Year range filter
 year_range = st.sidebar.slider(
     "Select Year Range",
@@ -40,77 +476,14 @@ year_range = st.sidebar.slider(
     value=(int(df['Year'].min()), int(df['Year'].max()))
 )
 
-# Filter data based on selection
-filtered_df = df[(df['Year'] >= year_range[0]) & (df['Year'] <= year_range[1])]
-
 # Main dashboard content
 col1, col2 = st.columns([2, 1])
 
 with col1:
-    st.subheader("📈 Wait Time Trends")
-    
-    # Time series chart
-    fig = go.Figure()
-    
-    # Fraser Institute data
-    fraser_data = filtered_df.dropna(subset=['Fraser_Wait_Time_Days'])
-    if not fraser_data.empty:
-        fig.add_trace(go.Scatter(
-            x=fraser_data['Year'], 
-            y=fraser_data['Fraser_Wait_Time_Days'],
-            mode='lines+markers',
-            name='Fraser Institute',
-            line=dict(color='#1f77b4', width=3),
-            marker=dict(size=8)
-        ))
-        
-        # Add trend line
-        z = np.polyfit(fraser_data['Year'], fraser_data['Fraser_Wait_Time_Days'], 1)
-        p = np.poly1d(z)
-        fig.add_trace(go.Scatter(
-            x=fraser_data['Year'], 
-            y=p(fraser_data['Year']),
-            mode='lines',
-            name='Trend Line',
-            line=dict(color='red', width=2, dash='dash')
-        ))
-    
-    # CIHI data (if available)
-    cihi_data = filtered_df.dropna(subset=['CIHI_Surgery_Median_Days'])
-    if not cihi_data.empty:
-        fig.add_trace(go.Scatter(
-            x=cihi_data['Year'], 
-            y=cihi_data['CIHI_Surgery_Median_Days'],
-            mode='lines+markers',
-            name='CIHI',
-            line=dict(color='#ff7f0e', width=3),
-            marker=dict(size=8)
-        ))
-    
-    fig.update_layout(
-        title="Healthcare Wait Times Over Time",
-        xaxis_title="Year",
-        yaxis_title="Wait Time (Days)",
-        height=400,
-        hovermode='x unified'
-    )
-    
-    st.plotly_chart(fig, use_container_width=True)
+    trend_component(selected_version, year_range)
 
 with col2:
-    st.subheader("📊 Key Statistics")
-    
-    if not fraser_data.empty:
-        stats = {
-            "Mean Wait Time": f"{fraser_data['Fraser_Wait_Time_Days'].mean():.0f} days",
-            "Median Wait Time": f"{fraser_data['Fraser_Wait_Time_Days'].median():.0f} days",
-            "Min Wait Time": f"{fraser_data['Fraser_Wait_Time_Days'].min():.0f} days",
-            "Max Wait Time": f"{fraser_data['Fraser_Wait_Time_Days'].max():.0f} days",
-            "Data Points": f"{len(fraser_data)} years"
-        }
-        
-        for metric, value in stats.items():
-            st.metric(metric, value)
+    statistics_component(selected_version, year_range)
 
 # Additional analysis sections
 st.markdown("---")
@@ -118,77 +491,22 @@ st.markdown("---")
 col3, col4 = st.columns(2)
 
 with col3:
-    st.subheader("📊 Decade Analysis")
-    
-    if not fraser_data.empty:
-        fraser_data['Decade'] = (fraser_data['Year'] // 10) * 10
-        decade_avg = fraser_data.groupby('Decade')['Fraser_Wait_Time_Days'].mean().reset_index()
-        
-        fig_decade = px.bar(
-            decade_avg, 
-            x='Decade', 
-            y='Fraser_Wait_Time_Days',
-            title="Average Wait Times by Decade",
-            labels={'Fraser_Wait_Time_Days': 'Average Wait Time (Days)'}
-        )
-        fig_decade.update_layout(height=400)
-        st.plotly_chart(fig_decade, use_container_width=True)
+    decade_component(selected_version, year_range)
 
 with col4:
-    st.subheader("📈 Year-over-Year Changes")
-    
-    if len(fraser_data) > 1:
-        fraser_data['YoY_Change'] = fraser_data['Fraser_Wait_Time_Days'].diff()
-        
-        fig_yoy = px.bar(
-            x=fraser_data['Year'][1:], 
-            y=fraser_data['YoY_Change'][1:],
-            title="Year-over-Year Change in Wait Times",
-            labels={'x': 'Year', 'y': 'Change in Days'}
-        )
-        fig_yoy.update_layout(height=400)
-        fig_yoy.add_hline(y=0, line_dash="dash", line_color="red")
-        st.plotly_chart(fig_yoy, use_container_width=True)
+    yoy_component(selected_version, year_range)
 
 # Data table
 st.markdown("---")
-st.subheader("📋 Raw Data")
-
-# Add download button
-csv = filtered_df.to_csv(index=False)
-st.download_button(
-    label="📥 Download filtered data as CSV",
-    data=csv,
-    file_name=f'wait_times_{year_range[0]}_{year_range[1]}.csv',
-    mime='text/csv'
-)
-
-# Display data table
-st.dataframe(
-    filtered_df,
-    use_container_width=True,
-    hide_index=True
-)
+raw_data_component(selected_version, year_range)
 
 # Insights section
 st.markdown("---")
-st.subheader("🔍 Key Insights")
+insights_component(selected_version, year_range)
 
-if not fraser_data.empty:
-    recent_avg = fraser_data[fraser_data['Year'] >= 2020]['Fraser_Wait_Time_Days'].mean()
-    older_avg = fraser_data[fraser_data['Year'] <= 2014]['Fraser_Wait_Time_Days'].mean()
-    
-    col5, col6, col7 = st.columns(3)
-    
-    with col5:
-        st.info(f"**Recent Trend (2020-2024):** {recent_avg:.0f} days average")
-    
-    with col6:
-        st.info(f"**Historical Average (2010-2014):** {older_avg:.0f} days average")
-    
-    with col7:
-        change_pct = ((recent_avg - older_avg) / older_avg * 100) if older_avg > 0 else 0
-        st.info(f"**Change:** {change_pct:+.1f}%")
+projections_component(selected_version)
+rankings_component(selected_version)
+anomalies_component(selected_version)
 
 # Footer
 st.markdown("---")
@@ -198,3 +516,6 @@ st.markdown("""
     <p>Last updated: {}</p>
 </div>
 """.format(pd.Timestamp.now().strftime("%B %d, %Y")), unsafe_allow_html=True)
+
+_record_render('full_run', run_start)
+render_stats_panel()